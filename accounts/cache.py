@@ -1,18 +1,134 @@
 import functools
+import hashlib
+import threading
+import time
 
 from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models.signals import post_delete, post_save
 
 
-def cache_using_pk(func):
+def namespace_version_key(namespace):
+    return f"namespace_version-{namespace}"
+
+
+def get_namespace_versions(namespaces):
+    keys = {namespace_version_key(namespace): namespace for namespace in namespaces}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        # Versions start from the current time so that an evicted version
+        # can never go back to a value that cached entries were stored with
+        cache.add(key, time.time_ns(), timeout=None)
+        versions[key] = cache.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate_namespace(namespace):
+    """
+    Invalidate everything cached in a namespace in O(1) by bumping its version
+    """
+    key = namespace_version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+class CachedModelMethod:
+    """
+    Cache the value of a model method per instance and arguments
+
+    Values are invalidated through versioned namespaces. namespaces is called
+    with the instance to get the namespaces its value belongs to, and depends_on
+    maps a model (or "app_label.ModelName") to a function that, given a saved or
+    deleted instance of that model, returns the namespaces to invalidate.
+    """
+
+    def __init__(self, func, ttl, version, namespaces, depends_on):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.ttl = ttl
+        self.version = version
+        self.namespaces = namespaces
+        self.depends_on = depends_on
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "total_miss_duration": 0,
+            "max_miss_duration": 0,
+        }
+
+    def __set_name__(self, owner, name):
+        self.name = f"{owner.__name__}.{name}"
+        for sender, get_namespaces in self.depends_on.items():
+            for action, signal in (("save", post_save), ("delete", post_delete)):
+                signal.connect(
+                    functools.partial(self.dependency_changed, get_namespaces),
+                    sender=sender,
+                    weak=False,
+                    dispatch_uid=f"invalidate_{self.name}_from_{sender}_{action}",
+                )
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return functools.partial(self.get, instance)
+
+    def cache_key(self, instance, args, kwargs):
+        arguments = ""
+        if args or kwargs:
+            arguments = hashlib.md5(
+                repr((args, sorted(kwargs.items()))).encode()
+            ).hexdigest()
+        return f"{self.name}-v{self.version}-{instance.pk}-{arguments}"
+
+    def get(self, instance, *args, **kwargs):
+        # Cached values are stored with the versions of their namespaces,
+        # so a hit only has to check that none of them has been bumped since
+        cache_key = self.cache_key(instance, args, kwargs)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            versions, value = cached
+            if get_namespace_versions(versions) == versions:
+                with self._stats_lock:
+                    self.stats["hits"] += 1
+                return value
+
+        start = time.monotonic()
+        versions = get_namespace_versions(self.namespaces(instance))
+        value = self.func(instance, *args, **kwargs)
+        cache.set(cache_key, (versions, value), timeout=self.ttl)
+
+        duration = time.monotonic() - start
+        with self._stats_lock:
+            self.stats["misses"] += 1
+            self.stats["total_miss_duration"] += duration
+            self.stats["max_miss_duration"] = max(
+                self.stats["max_miss_duration"], duration
+            )
+        return value
+
+    def dependency_changed(self, get_namespaces, sender, instance, **kwargs):
+        for namespace in get_namespaces(instance):
+            invalidate_namespace(namespace)
+
+
+def cache_model_method(namespaces, depends_on=None, ttl=DEFAULT_TIMEOUT, version=1):
     """
-    Given a model instance, cache the value from an instance method using the primary key
+    Cache a model method per instance and arguments for ttl seconds, until any
+    of its namespaces is invalidated
+
+    Bump version whenever the shape of the cached value changes.
     """
 
-    @functools.wraps(func)
-    def wrapper(instance, *args, **kwargs):
-        cache_key = f"{func.__name__}-{instance.pk}"
-        return cache.get_or_set(
-            cache_key, functools.partial(func, instance, *args, **kwargs)
+    def decorator(func):
+        return CachedModelMethod(
+            func,
+            ttl=ttl,
+            version=version,
+            namespaces=namespaces,
+            depends_on=depends_on or {},
         )
 
-    return wrapper
+    return decorator
@@ -4,8 +4,18 @@
 
 """
 
+import functools
+
 from django.conf import settings
 
+PROFILE_CONTEXT_KEYS = (
+    "artists",
+    "campaigns",
+    "percentage",
+    "total_earned",
+    "total_investments",
+)
+
 
 def keys(request):
     return {
@@ -15,8 +25,33 @@ def keys(request):
     }
 
 
+def get_profile_context(request):
+    """
+    Get the profile context of the authenticated user, computed at most once per request
+    """
+    if not hasattr(request, "_profile_context"):
+        request._profile_context = request.user.userprofile.profile_context()
+    return request._profile_context
+
+
+def get_profile_context_value(request, key):
+    return get_profile_context(request)[key]
+
+
+def get_nav_total_earned(request):
+    return request.user.userprofile.get_total_earned()
+
+
 def profile(request):
-    user = request.user
-    if user.is_authenticated:
-        return user.userprofile.profile_context()
+    # Templates call callables when they resolve a variable, so the
+    # profile context is only computed if a template actually uses it
+    if request.user.is_authenticated:
+        context = {
+            key: functools.partial(get_profile_context_value, request, key)
+            for key in PROFILE_CONTEXT_KEYS
+        }
+        # The navigation on every page only needs the total earned,
+        # which is cached on its own to keep the full profile context off them
+        context["nav_total_earned"] = functools.partial(get_nav_total_earned, request)
+        return context
     return {}
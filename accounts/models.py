@@ -12,9 +12,10 @@ from django.db import models
 from django.urls import reverse
 from sorl.thumbnail import get_thumbnail
 
-from accounts.cache import cache_using_pk
+from accounts.cache import cache_model_method
 from artist.models import Artist
-from campaign.models import Campaign, Investment
+from campaign.models import Campaign, Investment, Project
+from campaign.revenue import RevenueAttribution
 
 
 class UserAvatar(models.Model):
@@ -79,6 +80,49 @@ class UserAvatarImage(models.Model):
         return str(self.avatar)
 
 
+def user_profile_namespace(user_profile_id):
+    return f"user_profile-{user_profile_id}"
+
+
+def project_namespace(project_id):
+    return f"project-{project_id}"
+
+
+def use_project_namespaces():
+    return settings.PROFILE_CONTEXT_INVALIDATION == "project"
+
+
+def investment_profile_namespaces(investment):
+    # The investor's profile may already be gone when a user deletion cascades
+    user_profile_ids = UserProfile.objects.filter(
+        user__customer__charges=investment.charge_id
+    ).values_list("pk", flat=True)
+    return list(map(user_profile_namespace, user_profile_ids))
+
+
+def revenue_report_profile_namespaces(revenue_report):
+    if use_project_namespaces():
+        return [project_namespace(revenue_report.project_id)]
+
+    # Only the investors in the project of this revenue report are affected
+    user_profile_ids = (
+        Investment.objects.filter(
+            campaign__project=revenue_report.project_id,
+            charge__paid=True,
+            charge__refunded=False,
+        )
+        .values_list("charge__customer__user__userprofile", flat=True)
+        .distinct()
+    )
+    return list(map(user_profile_namespace, user_profile_ids))
+
+
+PROFILE_CACHE_DEPENDENCIES = {
+    "campaign.Investment": investment_profile_namespaces,
+    "campaign.RevenueReport": revenue_report_profile_namespaces,
+}
+
+
 class UserProfile(models.Model):
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -91,6 +135,7 @@ class UserProfile(models.Model):
     def prepare_artist_for_profile_context(artist):
         artist.total_invested = 0
         artist.total_earned = 0
+        artist.percentage = 0
         return artist.id, artist
 
     def __str__(self):
@@ -122,65 +167,95 @@ class UserProfile(models.Model):
         if not self.invest_anonymously:
             return reverse("public_profile", args=(self.user.username,))
 
+    def profile_namespaces(self):
+        namespaces = [user_profile_namespace(self.pk)]
+        if use_project_namespaces():
+            project_ids = (
+                Investment.objects.filter_user_investments(user=self.user)
+                .values_list("campaign__project", flat=True)
+                .distinct()
+            )
+            namespaces.extend(map(project_namespace, project_ids))
+        return namespaces
+
+    # Invalidated along with profile_context, which shares its namespaces
+    @cache_model_method(namespaces=profile_namespaces)
     def get_total_earned(self):
         investments = Investment.objects.filter_user_investments(user=self.user)
-        total_earned = sum(investment.generated_revenue() for investment in investments)
-        return total_earned
+        return RevenueAttribution(investments).user_revenue().get(self.user.id, 0)
 
-    @cache_using_pk
+    @cache_model_method(
+        namespaces=profile_namespaces,
+        depends_on=PROFILE_CACHE_DEPENDENCIES,
+        version=2,
+    )
     def profile_context(self):
         context = {}
 
-        # Get artists the user has invested in
+        # Get the shares the user has in each campaign, with its artist
         investments = Investment.objects.filter(
             charge__customer__user=self.user, charge__paid=True, charge__refunded=False
         )
-        campaign_ids = investments.values_list("campaign", flat=True).distinct()
-        campaigns = Campaign.objects.filter(id__in=campaign_ids).select_related(
-            "project"
+        campaign_shares = (
+            investments.values(
+                "campaign",
+                "campaign__value_per_share",
+                "campaign__project",
+                "campaign__project__artist",
+            )
+            .annotate(total_num_shares=models.Sum("num_shares"))
+            .order_by("campaign")
+        )
+        campaign_ids = [shares["campaign"] for shares in campaign_shares]
+        context["campaigns"] = Campaign.objects.filter(
+            id__in=campaign_ids
+        ).select_related("project")
+        artists = Artist.objects.filter(
+            id__in={shares["campaign__project__artist"] for shares in campaign_shares}
         )
-        context["campaigns"] = campaigns
-        artist_ids = campaigns.values_list("project__artist", flat=True).distinct()
-        artists = Artist.objects.filter(id__in=artist_ids)
         context["artists"] = dict(map(self.prepare_artist_for_profile_context, artists))
 
-        # Update context with total investments
-        aggregate_context = investments.aggregate(
-            total_investments=models.Sum(
-                models.F("campaign__value_per_share") * models.F("num_shares"),
-                output_field=models.FloatField(),
+        # Update context with total invested in each artist and total investments
+        for shares in campaign_shares:
+            artist = context["artists"][shares["campaign__project__artist"]]
+            artist.total_invested += (
+                shares["total_num_shares"] * shares["campaign__value_per_share"]
             )
-        )
-        context.update(aggregate_context)
-
-        # Update context with total invested and total earned
-        total_earned = 0
-        for campaign in campaigns:
-            artist = campaign.project.artist
-
-            # Total invested
-            investments_this_campaign = investments.filter(campaign=campaign)
-            num_shares_this_campaign = investments_this_campaign.aggregate(
-                ns=models.Sum("num_shares")
-            )["ns"]
-            context["artists"][artist.id].total_invested += (
-                num_shares_this_campaign * campaign.value_per_share
+        total_investments = None
+        if campaign_shares:
+            total_investments = float(
+                sum(artist.total_invested for artist in context["artists"].values())
             )
+        context["total_investments"] = total_investments
 
-            # Total earned
-            generated_revenue_user = 0
-            for investment in investments_this_campaign:
-                generated_revenue_user += investment.generated_revenue()
-            context["artists"][artist.id].total_earned += generated_revenue_user
-            total_earned += generated_revenue_user
-
-        # TODO(lucas): Could refactor to use get_total_earned() instead
+        # Update context with the user's ownership of each artist's active projects
+        artist_project_shares = {}
+        for shares in campaign_shares:
+            project_shares = artist_project_shares.setdefault(
+                shares["campaign__project__artist"], {}
+            )
+            key = self.user.id, shares["campaign__project"]
+            project_shares[key] = (
+                project_shares.get(key, 0) + shares["total_num_shares"]
+            )
+        ownership = Project.objects.filter(
+            id__in={shares["campaign__project"] for shares in campaign_shares}
+        ).ownership()
+        for artist_id, project_shares in artist_project_shares.items():
+            context["artists"][artist_id].percentage = ownership.investor_percentages(
+                project_shares
+            ).get(self.user.id, 0)
+
+        # Update context with total earned, overall and from each artist
+        revenue_attribution = RevenueAttribution(investments)
+        for artist_id, earned in revenue_attribution.artist_revenue().items():
+            context["artists"][artist_id].total_earned += earned
+        total_earned = revenue_attribution.user_revenue().get(self.user.id, 0)
         context["total_earned"] = total_earned
 
         # Add percentage of return to context
-        total_investments = aggregate_context["total_investments"] or 0
         try:
-            percentage = total_earned / total_investments * 100
+            percentage = total_earned / (total_investments or 0) * 100
         except ZeroDivisionError:
             percentage = 0
         context["percentage"] = percentage
@@ -7,16 +7,26 @@
 import re
 from unittest import mock
 
+import factory
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sessions.models import Session
-from django.core.cache import cache
-from django.test import override_settings
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 
+from accounts.context_processors import profile
 from accounts.factories import UserAvatarFactory, UserFactory, userfactory_factory
+from accounts.cache import invalidate_namespace
+from accounts.models import (
+    UserProfile,
+    investment_profile_namespaces,
+    user_profile_namespace,
+)
 from artist.factories import ArtistFactory
-from campaign.factories import InvestmentFactory, ProjectFactory
-from campaign.models import RevenueReport
+from campaign.factories import CampaignFactory, InvestmentFactory, ProjectFactory
+from campaign.models import Investment, RevenueReport
 from emails.models import VerifiedEmail
 from perdiem.tests import MigrationTestCase, PerDiemTestCase
 
@@ -185,19 +195,123 @@ class ProfileWebTestCase(PerDiemTestCase):
         return ["/profile/", f"/profile/{self.user.username}/"]
 
     def testUserProfileContextCaches(self):
-        # Request the profile context for a user
-        self.user.userprofile.profile_context()
-
-        # Verify that this user's profile context is in cache
-        self.assertIn(f"profile_context-{self.user.userprofile.pk}", cache)
-
-        # Create a new RevenueReport
+        # Request the profile context for an investor and another user
+        investment = InvestmentFactory(charge__customer__user=self.user)
+        other_user_profile = UserFactory().userprofile
+        for user_profile in (self.user.userprofile, other_user_profile):
+            user_profile.profile_context()
+
+        # Verify that both profile contexts are served from cache
+        with self.assertNumQueries(0):
+            for user_profile in (self.user.userprofile, other_user_profile):
+                user_profile.profile_context()
+
+        # Create a new RevenueReport for another project
         # We cannot use a factory to generate the RevenueReport here
         # because we actually need the post_save signals to be made
         RevenueReport.objects.create(project=ProjectFactory(), amount=100)
+        with self.assertNumQueries(0):
+            for user_profile in (self.user.userprofile, other_user_profile):
+                user_profile.profile_context()
+
+        # Verify that only the investor's profile context is no longer in cache
+        with self.assertNumQueries(2):
+            RevenueReport.objects.create(
+                project=investment.campaign.project, amount=100
+            )
+        with self.assertNumQueries(0):
+            other_user_profile.profile_context()
+        self.assertGreater(self.user.userprofile.profile_context()["total_earned"], 0)
+
+    def testCachedModelMethodStats(self):
+        profile_context = UserProfile.profile_context
+        user_profile = self.user.userprofile
+        invalidate_namespace(user_profile_namespace(user_profile.pk))
+        hits, misses = profile_context.stats["hits"], profile_context.stats["misses"]
+
+        # The first call misses and the next one is a hit
+        user_profile.profile_context()
+        user_profile.profile_context()
+        self.assertEqual(profile_context.stats["misses"], misses + 1)
+        self.assertEqual(profile_context.stats["hits"], hits + 1)
+
+        # Investing invalidates the investor's cached profile context
+        InvestmentFactory(charge__customer__user=self.user)
+        self.assertGreater(user_profile.profile_context()["total_investments"], 0)
+        self.assertEqual(profile_context.stats["misses"], misses + 2)
+
+    @override_settings(PROFILE_CONTEXT_INVALIDATION="project")
+    def testUserProfileContextProjectNamespaceInvalidation(self):
+        investment = InvestmentFactory(charge__customer__user=self.user)
+        user_profile = self.user.userprofile
+        self.assertEqual(user_profile.profile_context()["total_earned"], 0)
+
+        # Verify that the profile context is served from cache
+        with self.assertNumQueries(0):
+            user_profile.profile_context()
+
+        # Reporting revenue for another project does not query for investors
+        # and leaves the profile context valid
+        project = ProjectFactory()
+        with self.assertNumQueries(1):
+            RevenueReport.objects.create(project=project, amount=100)
+        with self.assertNumQueries(0):
+            user_profile.profile_context()
+
+        # Reporting revenue for the investor's project invalidates the profile context
+        with self.assertNumQueries(1):
+            RevenueReport.objects.create(
+                project=investment.campaign.project, amount=100
+            )
+        self.assertGreater(user_profile.profile_context()["total_earned"], 0)
+
+    def testProfileContextProcessorIsLazy(self):
+        InvestmentFactory(charge__customer__user=self.user)
+        request = RequestFactory().get("/faq/")
+        request.user = User.objects.get(id=self.user.id)
+        profile_context = UserProfile.profile_context
+        invalidate_namespace(user_profile_namespace(self.user.userprofile.pk))
+        misses = profile_context.stats["misses"]
+
+        # Verify that the profile context is not computed until it is used
+        with self.assertNumQueries(0):
+            context = profile(request)
+        self.assertEqual(profile_context.stats["misses"], misses)
+
+        # Verify that the profile context is computed once for all of its values
+        self.assertGreater(context["total_investments"](), 0)
+        with self.assertNumQueries(0):
+            context["total_earned"]()
+            context["artists"]()
+        self.assertEqual(profile_context.stats["misses"], misses + 1)
+
+    def testStaticPagesMakeNoProfileQueries(self):
+        InvestmentFactory(charge__customer__user=self.user)
+        profile_context = UserProfile.profile_context
+        invalidate_namespace(user_profile_namespace(self.user.userprofile.pk))
+        misses = profile_context.stats["misses"]
+
+        # Verify that static pages never compute the profile context
+        self.assertResponseRenders("/faq/")
+        self.assertEqual(profile_context.stats["misses"], misses)
+
+        # Verify that once the total earned in the navigation is cached,
+        # only the session, user and user profile (for the avatar) are queried
+        with self.assertNumQueries(3):
+            self.assertResponseRenders("/faq/")
+
+    def testInvestmentProfileNamespaces(self):
+        investment = InvestmentFactory()
+        user = investment.charge.customer.user
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                investment_profile_namespaces(investment),
+                [user_profile_namespace(user.userprofile.pk)],
+            )
 
-        # Verify that the user profile context is no longer in cache
-        self.assertNotIn(f"profile_context-{self.user.userprofile.pk}", cache)
+        # Verify that deleting the investor cascades to their investments
+        user.delete()
+        self.assertFalse(Investment.objects.filter(id=investment.id).exists())
 
     def testUserProfileContextContainsInvestments(self):
         investment = InvestmentFactory()
@@ -208,6 +322,46 @@ class ProfileWebTestCase(PerDiemTestCase):
             0,
         )
 
+    def testUserProfileContextContainsOwnership(self):
+        investment = InvestmentFactory(num_shares=10)
+        InvestmentFactory(campaign=investment.campaign, num_shares=30)
+        user = investment.charge.customer.user
+        artist = investment.campaign.project.artist
+
+        # Verify that the profile shares the ownership calculation of the artist page
+        artists = user.userprofile.profile_context()["artists"]
+        self.assertGreater(artists[artist.id].percentage, 0)
+        self.assertAlmostEqual(
+            artists[artist.id].percentage, artist.investors()[user.id]["percentage"]
+        )
+
+    def testUserProfileContextQueryCountIsConstant(self):
+        def count_profile_context_queries(user_profile):
+            # Compute the profile context without going through the cache
+            with CaptureQueriesContext(connection) as queries:
+                UserProfile.profile_context.func(user_profile)
+            return len(queries)
+
+        # Create an investor with a single investment
+        # and another with 500 investments across several campaigns
+        investment = InvestmentFactory()
+        other_investment = InvestmentFactory()
+        customer = other_investment.charge.customer
+        campaigns = [other_investment.campaign] + CampaignFactory.create_batch(4)
+        with factory.django.mute_signals(post_save):
+            for i in range(499):
+                InvestmentFactory(
+                    charge__customer=customer, campaign=campaigns[i % len(campaigns)]
+                )
+        for campaign in campaigns:
+            RevenueReport.objects.create(project=campaign.project, amount=100)
+
+        # Verify that the number of queries does not depend on the number of investments
+        self.assertEqual(
+            count_profile_context_queries(customer.user.userprofile),
+            count_profile_context_queries(investment.charge.customer.user.userprofile),
+        )
+
     def testInvalidProfilesAndAnonymousProfilesLookIdentical(self):
         # Create a user that will invest anonymously
         anonymous_user = UserFactory()
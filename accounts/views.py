@@ -14,6 +14,7 @@ from django.urls import reverse
 from django.views.generic import TemplateView
 from django.views.generic.edit import CreateView, FormView
 
+from accounts.context_processors import get_profile_context
 from accounts.forms import (
     ContactForm,
     EditAvatarForm,
@@ -224,7 +225,7 @@ class ProfileView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
 
         # Update context with profile information
-        context.update(self.request.user.userprofile.profile_context())
+        context.update(get_profile_context(self.request))
         context["albums"] = Album.objects.filter(
             project__campaign__in=context["campaigns"]
         ).distinct()
@@ -1,3 +1,143 @@
+import collections
+import contextlib
+import datetime
+import functools
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from geopy.geocoders import Nominatim
 
-geolocator = Nominatim(user_agent="PerDiem (+https://www.investperdiem.com/)")
+from artist.models import GeocodeCache
+
+GeocodedLocation = collections.namedtuple("GeocodedLocation", ["latitude", "longitude"])
+
+
+class NominatimGeocoder(Nominatim):
+    def __init__(self):
+        super().__init__(user_agent="PerDiem (+https://www.investperdiem.com/)")
+
+
+class StubGeocoder:
+    """
+    Offline geocoder for tests and local development
+    """
+
+    LOCATIONS = {
+        "los angeles, ca": GeocodedLocation(34.0522, -118.2437),
+        "toronto, on": GeocodedLocation(43.653226, -79.383184),
+        "waterloo, on, canada": GeocodedLocation(43.4643, -80.5204),
+    }
+
+    def geocode(self, query):
+        return self.LOCATIONS.get(normalize_address(query))
+
+
+def normalize_address(address):
+    address = " ".join(address.lower().split())
+    return re.sub(r"\s*,\s*", ", ", address).strip(", ")
+
+
+@functools.lru_cache(maxsize=None)
+def get_geocoder(backend):
+    return import_string(backend)()
+
+
+class CachedGeolocator:
+    """
+    Geocode addresses through an in-process LRU and the GeocodeCache table,
+    only asking the upstream geocoder (settings.GEOCODER_BACKEND) on a miss
+    """
+
+    MAX_LOCAL_CACHE_SIZE = 1024
+    CACHE_TTL = datetime.timedelta(days=30)
+    NEGATIVE_CACHE_TTL = datetime.timedelta(days=1)
+
+    def __init__(self):
+        self._local_cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._address_locks = {}
+
+    def clear(self):
+        with self._lock:
+            self._local_cache.clear()
+
+    def geocode(self, address):
+        address = normalize_address(address)
+        cached, location = self._get_local(address)
+        if cached:
+            return location
+
+        # Concurrent misses for the same address wait for a single lookup
+        with self._address_lock(address):
+            cached, location = self._get_local(address)
+            if cached:
+                return location
+
+            geocode_cache = GeocodeCache.objects.filter(address=address).first()
+            if geocode_cache and not self._is_expired(geocode_cache):
+                location = None
+                if geocode_cache.lat is not None:
+                    location = GeocodedLocation(geocode_cache.lat, geocode_cache.lon)
+            else:
+                # Timeouts propagate to the caller and are not cached
+                location = get_geocoder(settings.GEOCODER_BACKEND).geocode(address)
+                if location is not None:
+                    location = GeocodedLocation(location.latitude, location.longitude)
+                geocode_cache = GeocodeCache.objects.update_or_create(
+                    address=address,
+                    defaults={
+                        "lat": location.latitude if location else None,
+                        "lon": location.longitude if location else None,
+                    },
+                )[0]
+
+            self._set_local(address, location, geocode_cache.updated_datetime)
+            return location
+
+    def _is_expired(self, geocode_cache):
+        ttl = (
+            self.CACHE_TTL if geocode_cache.lat is not None else self.NEGATIVE_CACHE_TTL
+        )
+        return geocode_cache.updated_datetime + ttl < timezone.now()
+
+    def _get_local(self, address):
+        with self._lock:
+            if address not in self._local_cache:
+                return False, None
+            expires, location = self._local_cache[address]
+            if expires < time.monotonic():
+                del self._local_cache[address]
+                return False, None
+            self._local_cache.move_to_end(address)
+            return True, location
+
+    def _set_local(self, address, location, updated_datetime):
+        ttl = self.CACHE_TTL if location is not None else self.NEGATIVE_CACHE_TTL
+        remaining_seconds = (updated_datetime + ttl - timezone.now()).total_seconds()
+        with self._lock:
+            self._local_cache[address] = (
+                time.monotonic() + remaining_seconds,
+                location,
+            )
+            self._local_cache.move_to_end(address)
+            while len(self._local_cache) > self.MAX_LOCAL_CACHE_SIZE:
+                self._local_cache.popitem(last=False)
+
+    @contextlib.contextmanager
+    def _address_lock(self, address):
+        with self._lock:
+            address_lock = self._address_locks.setdefault(address, threading.Lock())
+        try:
+            with address_lock:
+                yield
+        finally:
+            with self._lock:
+                if self._address_locks.get(address) is address_lock:
+                    del self._address_locks[address]
+
+
+geolocator = CachedGeolocator()
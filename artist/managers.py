@@ -4,38 +4,45 @@
 
 """
 
-import geopy
+import numpy as np
 from django.db import models
+from django.db.models.functions import Cast, NullIf
 from django.utils import timezone
 from geopy.distance import distance as calc_distance
 
+from artist.spatial import (
+    cached_bounding_coordinates,
+    geohash_cells_q,
+    geohash_covering_cells,
+    haversine_miles,
+    longitude_q,
+    quantize_coordinate,
+)
+from campaign.models import Campaign
+
 
 class ArtistQuerySet(models.QuerySet):
-    @staticmethod
-    def bounding_coordinates(distance, lat, lon):
-        origin = geopy.Point((lat, lon))
-        geopy_distance = calc_distance(miles=distance)
-        min_lat = geopy_distance.destination(origin, 180).latitude
-        max_lat = geopy_distance.destination(origin, 0).latitude
-        min_lon = geopy_distance.destination(origin, 270).longitude
-        max_lon = geopy_distance.destination(origin, 90).longitude
-        return min_lat, max_lat, min_lon, max_lon
+
+    LOCATION_ACCURACY_HAVERSINE = "haversine"
+    LOCATION_ACCURACY_GEODESIC = "geodesic"
+
+    # Haversine on a sphere differs from the geodesic distance on the WGS-84
+    # ellipsoid by at most ~0.56%, so only rows this close to the radius are rechecked
+    BORDERLINE_DISTANCE_TOLERANCE = 0.006
 
     @staticmethod
-    def percentage_funded(artist):
-        campaign = artist.latest_campaign()
-        if campaign:
-            funded = campaign.percentage_funded()
-            artist.funded = funded
-            return funded
+    def bounding_coordinates(distance, lat, lon):
+        return cached_bounding_coordinates(
+            quantize_coordinate(distance),
+            quantize_coordinate(lat),
+            quantize_coordinate(lon),
+        )
 
     @staticmethod
-    def valuation(artist):
-        campaign = artist.latest_campaign()
-        if campaign:
-            valuation = campaign.valuation()
-            artist.valuation = valuation
-            return valuation
+    def latest_campaigns():
+        return Campaign.objects.filter(
+            project__artist=models.OuterRef("pk"), start_datetime__lt=timezone.now()
+        ).order_by("-start_datetime")
 
     def filter_by_genre(self, genre):
         if genre != "All Genres":
@@ -52,34 +59,67 @@ class ArtistQuerySet(models.QuerySet):
 
         return self.filter(id__in=funded_artist_ids)
 
-    def filter_by_location(self, distance, lat, lon):
+    def filter_by_location(
+        self, distance, lat, lon, accuracy=LOCATION_ACCURACY_GEODESIC
+    ):
         min_lat, max_lat, min_lon, max_lon = self.bounding_coordinates(
             distance, lat, lon
         )
-        artists_within_bounds = self.filter(
-            lat__gte=min_lat, lat__lte=max_lat, lon__gte=min_lon, lon__lte=max_lon
-        )
-
-        nearby_artist_ids = []
-        for artist in artists_within_bounds:
-            if calc_distance((lat, lon), (artist.lat, artist.lon)).miles <= distance:
-                nearby_artist_ids.append(artist.id)
-        return self.filter(id__in=nearby_artist_ids)
+        cells = geohash_covering_cells(min_lat, max_lat, min_lon, max_lon)
+        candidates = np.array(
+            self.filter(
+                geohash_cells_q(cells),
+                longitude_q(min_lon, max_lon),
+                lat__gte=min_lat,
+                lat__lte=max_lat,
+            ).values_list("id", "lat", "lon"),
+            dtype=float,
+        ).reshape(-1, 3)
+        artist_ids, lats, lons = candidates.T
+
+        distances = haversine_miles(lat, lon, lats, lons)
+        nearby = distances <= distance
+        if accuracy == self.LOCATION_ACCURACY_GEODESIC:
+            borderline = np.flatnonzero(
+                np.abs(distances - distance)
+                <= distance * self.BORDERLINE_DISTANCE_TOLERANCE
+            )
+            for i in borderline:
+                nearby[i] = (
+                    calc_distance((lat, lon), (lats[i], lons[i])).miles <= distance
+                )
+        return self.filter(id__in=artist_ids[nearby].astype(int).tolist())
 
-    # TODO(lucas): Use annotations as much as possible to improve performance
     def exclude_failed_artists(self):
-        excluded_artist_ids = []
-        for artist in self:
-            if artist.all_campaigns_failed():
-                excluded_artist_ids.append(artist.id)
-
-        return self.exclude(id__in=excluded_artist_ids)
+        # Mirrors Artist.all_campaigns_failed() for every artist in a single query
+        now = timezone.now()
+        campaigns = Campaign.objects.filter(project__artist=models.OuterRef("pk"))
+        active_campaigns = campaigns.filter(start_datetime__lt=now).filter(
+            models.Q(end_datetime__isnull=True) | models.Q(end_datetime__gte=now)
+        )
+        past_campaigns = campaigns.filter(end_datetime__lt=now)
+        funded_past_campaigns = past_campaigns.annotate_percentage_funded().filter(
+            funded=100
+        )
+        failed_artists = self.annotate(
+            has_active_campaign=models.Exists(active_campaigns),
+            has_past_campaign=models.Exists(past_campaigns),
+            has_funded_past_campaign=models.Exists(funded_past_campaigns),
+        ).filter(
+            has_active_campaign=False,
+            has_past_campaign=True,
+            has_funded_past_campaign=False,
+        )
+        return self.exclude(id__in=failed_artists.values("id"))
 
-    # TODO(lucas): Use annotations as much as possible to improve performance
     def order_by_percentage_funded(self):
-        return sorted(
-            self, key=lambda artist: self.percentage_funded(artist) or 0, reverse=True
-        )
+        latest_campaigns = self.latest_campaigns().annotate_percentage_funded()
+        return self.annotate(
+            funded=models.Subquery(
+                latest_campaigns.values("funded")[:1],
+                output_field=models.IntegerField(),
+            )
+        ).order_by(models.F("funded").desc(nulls_last=True))
 
     def order_by_time_remaining(self):
         artists = self.annotate(
@@ -135,6 +175,20 @@ class ArtistQuerySet(models.QuerySet):
         ).order_by("-amount_raised")
 
     def order_by_valuation(self):
-        return sorted(
-            self, key=lambda artist: self.valuation(artist) or 0, reverse=True
+        # Mirrors Campaign.valuation() of each artist's latest campaign
+        latest_campaigns = self.latest_campaigns().annotate(
+            valuation=models.ExpressionWrapper(
+                models.F("amount")
+                * (
+                    Cast(models.Value(100), models.FloatField())
+                    / NullIf("fans_percentage", 0)
+                ),
+                output_field=models.FloatField(),
+            )
         )
+        return self.annotate(
+            valuation=models.Subquery(
+                latest_campaigns.values("valuation")[:1],
+                output_field=models.FloatField(),
+            )
+        ).order_by(models.F("valuation").desc(nulls_last=True))
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.14 on 2026-10-18 03:12
+
+from django.db import migrations, models
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    # A copy of artist.spatial.geohash_encode as of this migration
+    lat, lon = float(lat), float(lon)
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash = []
+    bits, num_bits, is_lon_bit = 0, 0, True
+    while len(geohash) < precision:
+        coordinate_range, value = (lon_range, lon) if is_lon_bit else (lat_range, lat)
+        mid = (coordinate_range[0] + coordinate_range[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            coordinate_range[0] = mid
+        else:
+            bits = bits * 2
+            coordinate_range[1] = mid
+        is_lon_bit = not is_lon_bit
+        num_bits += 1
+        if num_bits == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits, num_bits = 0, 0
+    return "".join(geohash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("artist", "0013_auto_20170511_0508")]
+
+    def set_artist_geohashes(apps, schema_editor):
+        Artist = apps.get_model("artist", "Artist")
+        artists = list(Artist.objects.all())
+        for artist in artists:
+            artist.geohash = geohash_encode(artist.lat, artist.lon)
+        Artist.objects.bulk_update(artists, ["geohash"])
+
+    operations = [
+        migrations.AddField(
+            model_name="artist",
+            name="geohash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                help_text="Geohash of artist location (kept in sync with lat and lon)",
+                max_length=12,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(set_artist_geohashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 2.2.14 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("artist", "0014_artist_geohash")]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeocodeCache",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "address",
+                    models.TextField(
+                        help_text="Normalized address that was geocoded", unique=True
+                    ),
+                ),
+                (
+                    "lat",
+                    models.FloatField(
+                        blank=True,
+                        help_text="Latitude of address (empty if not found)",
+                        null=True,
+                    ),
+                ),
+                (
+                    "lon",
+                    models.FloatField(
+                        blank=True,
+                        help_text="Longitude of address (empty if not found)",
+                        null=True,
+                    ),
+                ),
+                (
+                    "updated_datetime",
+                    models.DateTimeField(auto_now=True, db_index=True),
+                ),
+            ],
+            options={"verbose_name_plural": "Geocode cache"},
+        )
+    ]
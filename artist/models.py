@@ -12,6 +12,7 @@ from django.utils.html import escape
 from markdown_deux.templatetags.markdown_deux_tags import markdown_allowed
 
 from artist.managers import ArtistQuerySet
+from artist.spatial import geohash_encode
 from campaign.models import Campaign, Investment
 
 
@@ -48,12 +49,24 @@ class Artist(models.Model):
         max_length=40,
         help_text="Description of artist location (usually city, state, country format)",
     )
+    geohash = models.CharField(
+        max_length=12,
+        null=True,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text="Geohash of artist location (kept in sync with lat and lon)",
+    )
 
     objects = ArtistQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.geohash = geohash_encode(self.lat, self.lon)
+        super().save(*args, **kwargs)
+
     def url(self):
         return reverse("artist", kwargs={"slug": self.slug})
 
@@ -115,10 +128,7 @@ class Artist(models.Model):
         ).exists()
 
     def investors(self):
-        investors = {}
-        for project in self.project_set.all():
-            investors = project.project_investors(investors=investors)
-        return investors
+        return self.project_set.all().investors()
 
 
 class ArtistAdmin(models.Model):
@@ -308,3 +318,23 @@ class UpdateMediaURL(models.Model):
             """.format(
                 url=url
             )
+
+
+class GeocodeCache(models.Model):
+
+    address = models.TextField(
+        unique=True, help_text="Normalized address that was geocoded"
+    )
+    lat = models.FloatField(
+        null=True, blank=True, help_text="Latitude of address (empty if not found)"
+    )
+    lon = models.FloatField(
+        null=True, blank=True, help_text="Longitude of address (empty if not found)"
+    )
+    updated_datetime = models.DateTimeField(db_index=True, auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Geocode cache"
+
+    def __str__(self):
+        return self.address
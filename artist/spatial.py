@@ -0,0 +1,147 @@
+import functools
+import math
+import operator
+
+import geopy
+import numpy as np
+from django.db import models
+from geopy.distance import distance as calc_distance
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+MAX_COVERING_PRECISION = 6
+MAX_COVERING_CELLS = 32
+EARTH_RADIUS_MILES = 3958.7613
+COORDINATE_DECIMAL_PLACES = 4
+COORDINATE_QUANTIZATION_ERROR = 0.5 / 10 ** COORDINATE_DECIMAL_PLACES
+MAX_MILES_PER_DEGREE = 69.5
+BOUNDING_COORDINATES_CACHE_SIZE = 1024
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat, lon = float(lat), float(lon)
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash = []
+    bits, num_bits, is_lon_bit = 0, 0, True
+    while len(geohash) < precision:
+        coordinate_range, value = (lon_range, lon) if is_lon_bit else (lat_range, lat)
+        mid = (coordinate_range[0] + coordinate_range[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            coordinate_range[0] = mid
+        else:
+            bits = bits * 2
+            coordinate_range[1] = mid
+        is_lon_bit = not is_lon_bit
+        num_bits += 1
+        if num_bits == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits, num_bits = 0, 0
+    return "".join(geohash)
+
+
+def geohash_cell_size(precision):
+    num_lat_bits = 5 * precision // 2
+    num_lon_bits = 5 * precision - num_lat_bits
+    return 180.0 / 2 ** num_lat_bits, 360.0 / 2 ** num_lon_bits
+
+
+def longitude_ranges(min_lon, max_lon):
+    """
+    Split a longitude range that crosses the antimeridian (min_lon > max_lon) in two
+    """
+    if min_lon > max_lon:
+        return [(min_lon, 180.0), (-180.0, max_lon)]
+    return [(min_lon, max_lon)]
+
+
+def geohash_covering_cells(min_lat, max_lat, min_lon, max_lon):
+    """
+    Find the geohash cells (at the finest precision within MAX_COVERING_CELLS) that cover a bounding box
+    """
+    min_lat, max_lat = max(float(min_lat), -90.0), min(float(max_lat), 90.0)
+    min_lon, max_lon = max(float(min_lon), -180.0), min(float(max_lon), 180.0)
+    if min_lon > max_lon:
+        return set().union(
+            *(
+                geohash_covering_cells(min_lat, max_lat, *lon_range)
+                for lon_range in longitude_ranges(min_lon, max_lon)
+            )
+        )
+
+    for precision in range(MAX_COVERING_PRECISION, 0, -1):
+        lat_size, lon_size = geohash_cell_size(precision)
+        first_row = math.floor((min_lat + 90) / lat_size)
+        first_col = math.floor((min_lon + 180) / lon_size)
+        num_rows = math.floor((max_lat + 90) / lat_size) - first_row + 1
+        num_cols = math.floor((max_lon + 180) / lon_size) - first_col + 1
+        if num_rows * num_cols <= MAX_COVERING_CELLS:
+            break
+
+    return {
+        geohash_encode(
+            min((first_row + row + 0.5) * lat_size - 90, 90.0),
+            min((first_col + col + 0.5) * lon_size - 180, 180.0),
+            precision=precision,
+        )
+        for row in range(num_rows)
+        for col in range(num_cols)
+    }
+
+
+def geohash_cells_q(cells, field_name="geohash"):
+    if not cells:
+        return models.Q(pk__in=[])
+    return functools.reduce(
+        operator.or_,
+        (models.Q(**{f"{field_name}__startswith": cell}) for cell in cells),
+    )
+
+
+def longitude_q(min_lon, max_lon, field_name="lon"):
+    return functools.reduce(
+        operator.or_,
+        (
+            models.Q(
+                **{f"{field_name}__gte": range_min, f"{field_name}__lte": range_max}
+            )
+            for range_min, range_max in longitude_ranges(min_lon, max_lon)
+        ),
+    )
+
+
+def haversine_miles(lat, lon, lats, lons):
+    lat, lon = np.radians(float(lat)), np.radians(float(lon))
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = (
+        np.sin((lats - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+def quantize_coordinate(value):
+    # Rounded so that nearby searches share bounding coordinates. This moves the
+    # search by up to COORDINATE_QUANTIZATION_ERROR, which the cached bounding box
+    # is padded by, while distances are still measured from the exact origin
+    return round(float(value), COORDINATE_DECIMAL_PLACES)
+
+
+# The furthest an artist within the searched distance of the exact origin can be
+# from the quantized origin, beyond the quantized distance: half a step of both
+# latitude and longitude (a degree of either is at most ~69.4 miles), plus half
+# a step of the distance itself
+QUANTIZATION_ERROR_MILES = COORDINATE_QUANTIZATION_ERROR * (
+    math.sqrt(2) * MAX_MILES_PER_DEGREE + 1
+)
+
+
+@functools.lru_cache(maxsize=BOUNDING_COORDINATES_CACHE_SIZE)
+def cached_bounding_coordinates(distance, lat, lon):
+    origin = geopy.Point((lat, lon))
+    geopy_distance = calc_distance(miles=distance + QUANTIZATION_ERROR_MILES)
+    min_lat = geopy_distance.destination(origin, 180).latitude
+    max_lat = geopy_distance.destination(origin, 0).latitude
+    min_lon = geopy_distance.destination(origin, 270).longitude
+    max_lon = geopy_distance.destination(origin, 90).longitude
+    return min_lat, max_lat, min_lon, max_lon
@@ -9,7 +9,9 @@ from unittest import mock
 
 import factory
 from django.core.management import call_command
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from geopy.exc import GeocoderTimedOut
 
@@ -20,9 +22,21 @@ from artist.factories import (
     artistfactory_factory,
     updatefactory_factory,
 )
-from artist.models import Artist
+from artist.geolocator import GeocodedLocation, StubGeocoder, geolocator
+from artist.managers import ArtistQuerySet
+from artist.models import Artist, GeocodeCache
 from artist.models import Playlist as PlaylistConst
-from campaign.factories import CampaignFactory, InvestmentFactory
+from artist.spatial import (
+    cached_bounding_coordinates,
+    geohash_cells_q,
+    geohash_encode,
+)
+from campaign.factories import (
+    CampaignFactory,
+    CustomerFactory,
+    InvestmentFactory,
+    ProjectFactory,
+)
 from perdiem.tests import MigrationTestCase, PerDiemTestCase
 
 
@@ -66,6 +80,22 @@ class SoundCloudPlaylistToPlaylistMigrationTestCase(MigrationTestCase):
         self.assertEqual(playlist.uri, self.soundcloudplaylist.playlist)
 
 
+class SetArtistGeohashesMigrationTestCase(MigrationTestCase):
+
+    migrate_from = "0013_auto_20170511_0508"
+    migrate_to = "0014_artist_geohash"
+
+    def setUpBeforeMigration(self, apps):
+        # Create an artist
+        ArtistFactoryForMigrationTestCase = artistfactory_factory(apps=apps)
+        self.artist = ArtistFactoryForMigrationTestCase()
+
+    def testArtistsHaveGeohashes(self):
+        Artist = self.apps.get_model("artist", "Artist")
+        artist = Artist.objects.get(id=self.artist.id)
+        self.assertEqual(artist.geohash, geohash_encode(artist.lat, artist.lon))
+
+
 class ArtistModelsTestCase(TestCase):
     def testUnicodeOfGenreIsGenreName(self):
         genre = GenreFactory()
@@ -79,6 +109,51 @@ class ArtistModelsTestCase(TestCase):
         artist_admin = ArtistAdminFactory()
         self.assertEqual(str(artist_admin), str(artist_admin.user))
 
+    def testInvestorsAggregatesAcrossProjects(self):
+        now = timezone.now()
+        active_campaign = CampaignFactory(amount=1000, fans_percentage=20)
+        artist = active_campaign.project.artist
+        past_campaign = CampaignFactory(
+            project=ProjectFactory(artist=artist),
+            value_per_share=2,
+            start_datetime=now - datetime.timedelta(days=60),
+            end_datetime=now - datetime.timedelta(days=30),
+        )
+
+        # One investor invests in both projects and the others in only one of them
+        customer = CustomerFactory()
+        for campaign, num_shares in (
+            (active_campaign, 2),
+            (active_campaign, 3),
+            (past_campaign, 5),
+        ):
+            InvestmentFactory(
+                charge__customer=customer, campaign=campaign, num_shares=num_shares
+            )
+        InvestmentFactory(campaign=active_campaign, num_shares=10)
+        InvestmentFactory(campaign=past_campaign)
+        InvestmentFactory(campaign=active_campaign, charge__refunded=True)
+
+        investors = artist.investors()
+        self.assertEqual(len(investors), 3)
+        investor = investors[customer.user.id]
+        self.assertEqual(investor["num_shares"], 10)
+        self.assertEqual(investor["total_investment"], 15)
+        self.assertAlmostEqual(investor["percentage"], 0.1)
+        self.assertEqual(
+            sorted(investor["percentage"] for investor in investors.values()),
+            [0, 0.1, 0.2],
+        )
+
+        # Verify that the number of queries does not grow with the number of investors
+        with CaptureQueriesContext(connection) as queries:
+            artist.investors()
+        for _ in range(5):
+            InvestmentFactory(campaign=active_campaign)
+            InvestmentFactory(campaign=past_campaign)
+        with self.assertNumQueries(len(queries)):
+            artist.investors()
+
 
 class ArtistManagerTestCase(TestCase):
     @mock.patch("campaign.models.Campaign.percentage_funded")
@@ -96,6 +171,145 @@ class ArtistManagerTestCase(TestCase):
         self.assertIn(funded_campaign.project.artist, funded_artists)
         self.assertNotIn(artist_without_campaign, funded_artists)
 
+    def testFilterByLocation(self):
+        lat, lon = 43.7689, -79.4138
+        nearby_artist = ArtistFactory(lat=43.8, lon=-79.4)
+        far_artist = ArtistFactory(lat=45.0, lon=-79.4)
+        ArtistFactory(lat=-33.8688, lon=151.2093)
+
+        # This artist is 49.98 miles away by geodesic distance
+        # but just over 50 miles away by haversine distance
+        borderline_artist = ArtistFactory(lat=44.4928, lon=-79.4138)
+        self.assertEqual(
+            borderline_artist.geohash,
+            geohash_encode(borderline_artist.lat, borderline_artist.lon),
+        )
+
+        # Verify that the candidates are fetched in a single query
+        with self.assertNumQueries(1):
+            nearby_artists = Artist.objects.filter_by_location(50, lat, lon)
+        self.assertEqual(set(nearby_artists), {nearby_artist, borderline_artist})
+
+        # Verify that the haversine accuracy mode skips the geodesic fallback
+        nearby_artists = Artist.objects.filter_by_location(
+            50, lat, lon, accuracy=ArtistQuerySet.LOCATION_ACCURACY_HAVERSINE
+        )
+        self.assertEqual(set(nearby_artists), {nearby_artist})
+
+        # Verify that a wider radius includes the artist further away
+        nearby_artists = Artist.objects.filter_by_location(100, lat, lon)
+        self.assertEqual(
+            set(nearby_artists), {nearby_artist, borderline_artist, far_artist}
+        )
+
+    def testFilterByLocationAcrossAntimeridian(self):
+        east_artist = ArtistFactory(lat=0, lon=179.95)
+        west_artist = ArtistFactory(lat=0, lon=-179.95)
+        ArtistFactory(lat=0, lon=178)
+
+        # Verify that search areas crossing the antimeridian include both sides of it
+        for lon in (179.9, -179.95):
+            nearby_artists = Artist.objects.filter_by_location(50, 0, lon)
+            self.assertEqual(set(nearby_artists), {east_artist, west_artist})
+        self.assertEqual(geohash_cells_q(set()).children, [("pk__in", [])])
+
+    def testFilterByLocationFromUnquantizedOrigin(self):
+        # This artist is 0.9935 miles from the search origin,
+        # but 0.9963 miles from the origin quantized to (0, 0)
+        artist = ArtistFactory(lat=0.0145, lon=0)
+
+        # Verify that the cached bounding box still includes the artist
+        nearby_artists = Artist.objects.filter_by_location(0.995, 0.00004, 0)
+        self.assertEqual(set(nearby_artists), {artist})
+
+    def testBoundingCoordinatesAreMemoized(self):
+        cached_bounding_coordinates.cache_clear()
+
+        # Coordinates that only differ beyond the stored precision share a cache entry
+        bounds = Artist.objects.bounding_coordinates(50, 43.76891, -79.41379)
+        with mock.patch("geopy.distance.distance.destination") as mock_destination:
+            cached_bounds = Artist.objects.bounding_coordinates(50, "43.7689", -79.4138)
+        mock_destination.assert_not_called()
+        self.assertEqual(cached_bounds, bounds)
+
+        cache_info = cached_bounding_coordinates.cache_info()
+        self.assertEqual((cache_info.hits, cache_info.misses), (1, 1))
+
+    def testOrderByPercentageFundedMatchesCampaigns(self):
+        # Create campaigns funded to various percentages, including ones that
+        # exercise the rounding rules in Campaign.funded_rounding()
+        campaigns = [
+            CampaignFactory(amount=amount) for amount in (0, 100, 100, 1000, 10000)
+        ]
+        InvestmentFactory(campaign=campaigns[1], num_shares=7)
+        InvestmentFactory(campaign=campaigns[2], num_shares=99)
+        InvestmentFactory(campaign=campaigns[3], num_shares=995)
+        InvestmentFactory(campaign=campaigns[4], num_shares=5000, charge__refunded=True)
+
+        # Verify that the artists are ordered in a single query
+        with self.assertNumQueries(1):
+            ordered_artists = list(Artist.objects.order_by_percentage_funded())
+
+        # Verify that the annotation agrees with the campaign's own calculation
+        for artist in ordered_artists:
+            self.assertEqual(
+                artist.funded, artist.latest_campaign().percentage_funded()
+            )
+        funded = [artist.funded for artist in ordered_artists]
+        self.assertEqual(funded, sorted(funded, reverse=True))
+
+    def testOrderByValuationMatchesCampaigns(self):
+        # Create campaigns with various valuations
+        for amount, fans_percentage in ((1000, 20), (500, 3), (10000, 50)):
+            CampaignFactory(amount=amount, fans_percentage=fans_percentage)
+        artist_without_campaign = ArtistFactory()
+
+        # Verify that the artists are ordered in a single query
+        with self.assertNumQueries(1):
+            ordered_artists = list(Artist.objects.order_by_valuation())
+
+        # Verify that the annotation agrees with the campaign's own calculation
+        for artist in ordered_artists[:-1]:
+            self.assertEqual(artist.valuation, artist.latest_campaign().valuation())
+        valuations = [artist.valuation for artist in ordered_artists[:-1]]
+        self.assertEqual(valuations, sorted(valuations, reverse=True))
+        self.assertEqual(ordered_artists[-1], artist_without_campaign)
+        self.assertIsNone(ordered_artists[-1].valuation)
+
+    def testExcludeFailedArtistsMatchesAllCampaignsFailed(self):
+        now = timezone.now()
+        past = {
+            "start_datetime": now - datetime.timedelta(days=60),
+            "end_datetime": now - datetime.timedelta(days=30),
+        }
+
+        # Create artists without campaigns, with active campaigns
+        # and with past campaigns that were underfunded, funded and overfunded
+        ArtistFactory()
+        CampaignFactory()
+        CampaignFactory(amount=100, **past)
+        for num_shares in (100, 101):
+            campaign = CampaignFactory(amount=100, **past)
+            InvestmentFactory(campaign=campaign, num_shares=num_shares)
+
+        # Verify that the same artists are excluded as with all_campaigns_failed()
+        expected_artists = [
+            artist
+            for artist in Artist.objects.order_by("id")
+            if not artist.all_campaigns_failed()
+        ]
+        self.assertEqual(len(expected_artists), 3)
+        with self.assertNumQueries(1):
+            artists = list(Artist.objects.exclude_failed_artists().order_by("id"))
+        self.assertEqual(artists, expected_artists)
+
+        # Verify that the number of queries does not grow with the number of artists
+        for _ in range(10):
+            CampaignFactory(amount=100, **past)
+        with self.assertNumQueries(1):
+            artists = list(Artist.objects.exclude_failed_artists().order_by("id"))
+        self.assertEqual(artists, expected_artists)
+
     def testOrderArtistsWithoutCampaign(self):
         funded_campaign = CampaignFactory()
         InvestmentFactory(campaign=funded_campaign)
@@ -120,6 +334,52 @@ class ArtistManagerTestCase(TestCase):
             )
 
 
+@override_settings(GEOCODER_BACKEND="artist.geolocator.StubGeocoder")
+class GeolocatorTestCase(TestCase):
+    def setUp(self):
+        geolocator.clear()
+
+    @mock.patch.object(
+        StubGeocoder, "geocode", autospec=True, side_effect=StubGeocoder.geocode
+    )
+    def testGeocodeIsCached(self, mock_geocode):
+        # Addresses are normalized so that equivalent lookups share a cache entry
+        toronto = GeocodedLocation(43.653226, -79.383184)
+        self.assertEqual(geolocator.geocode("Toronto, ON"), toronto)
+        self.assertEqual(geolocator.geocode("  toronto ,ON "), toronto)
+        self.assertEqual(mock_geocode.call_count, 1)
+
+        # Verify that the database cache survives the in-process cache
+        geolocator.clear()
+        self.assertEqual(geolocator.geocode("Toronto, ON"), toronto)
+        self.assertEqual(mock_geocode.call_count, 1)
+        self.assertEqual(GeocodeCache.objects.get().address, "toronto, on")
+
+        # Once the cached result expires, the upstream geocoder is asked again
+        GeocodeCache.objects.update(
+            updated_datetime=timezone.now() - datetime.timedelta(days=31)
+        )
+        geolocator.clear()
+        self.assertEqual(geolocator.geocode("Toronto, ON"), toronto)
+        self.assertEqual(mock_geocode.call_count, 2)
+
+    @mock.patch.object(
+        StubGeocoder, "geocode", autospec=True, side_effect=StubGeocoder.geocode
+    )
+    def testGeocodeCachesMissingAddresses(self, mock_geocode):
+        self.assertIsNone(geolocator.geocode("Atlantis"))
+        geolocator.clear()
+        self.assertIsNone(geolocator.geocode("Atlantis"))
+        self.assertEqual(mock_geocode.call_count, 1)
+        self.assertIsNone(GeocodeCache.objects.get().lat)
+
+    @mock.patch.object(StubGeocoder, "geocode", side_effect=GeocoderTimedOut)
+    def testGeocodeTimeoutIsNotCached(self, mock_geocode):
+        with self.assertRaises(GeocoderTimedOut):
+            geolocator.geocode("Toronto, ON")
+        self.assertFalse(GeocodeCache.objects.exists())
+
+
 class ArtistAdminWebTestCase(PerDiemTestCase):
     def testLocationWidgetRenders(self):
         self.assertResponseRenders("/admin/artist/artist/add/")
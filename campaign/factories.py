@@ -57,6 +57,7 @@ class CustomerFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = django_apps.get_model("pinax_stripe", "Customer")
 
+    stripe_id = factory.Sequence(lambda n: f"cus_{n}")
     user = factory.SubFactory(UserFactory)
 
 
@@ -64,6 +65,7 @@ class ChargeFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = django_apps.get_model("pinax_stripe", "Charge")
 
+    stripe_id = factory.Sequence(lambda n: f"ch_{n}")
     customer = factory.SubFactory(CustomerFactory)
     paid = True
     refunded = False
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from campaign.models import CampaignFundingStats
+
+
+class Command(BaseCommand):
+
+    help = "Rebuild campaign funding stats from investments and verify them against live aggregates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify-only",
+            action="store_true",
+            help="Verify the stored funding stats without rebuilding them",
+        )
+
+    def handle(self, *args, **options):
+        if not options["verify_only"]:
+            funding_stats = CampaignFundingStats.objects.rebuild()
+            self.stdout.write(
+                "Rebuilt funding stats for {num_campaigns} campaigns.".format(
+                    num_campaigns=len(funding_stats)
+                )
+            )
+
+        mismatched_campaign_ids = CampaignFundingStats.objects.verify()
+        if mismatched_campaign_ids:
+            raise CommandError(
+                "Funding stats do not match live aggregates for campaigns: {campaign_ids}".format(
+                    campaign_ids=", ".join(map(str, mismatched_campaign_ids))
+                )
+            )
+        self.stdout.write(self.style.SUCCESS("Funding stats match live aggregates."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from campaign.models import LeaderboardEntry
+from campaign.views import leaderboard_cache
+
+
+class Command(BaseCommand):
+
+    help = "Refresh the leaderboard for investors affected by new investments or revenue reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recalculate the leaderboard entries of all investors",
+        )
+
+    def handle(self, *args, **options):
+        if options["full"]:
+            leaderboard_entries = LeaderboardEntry.objects.refresh()
+        else:
+            leaderboard_entries = LeaderboardEntry.objects.refresh_incremental()
+        leaderboard_cache.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Refreshed leaderboard entries for {num_investors} investors.".format(
+                    num_investors=len(leaderboard_entries)
+                )
+            )
+        )
@@ -1,4 +1,242 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Cast, Ceil, Coalesce, Floor, NullIf
+from django.utils import timezone
+
+
+class ProjectOwnership:
+    """
+    Percentage ownership of projects, calculated from their campaigns in a single pass
+    """
+
+    def __init__(self, campaigns):
+        now = timezone.now()
+        self.total_num_shares = {}
+        self.total_fans_percentage = {}
+        self.active_project_ids = set()
+        for campaign in campaigns:
+            project_id = campaign["project"]
+            self.total_num_shares[project_id] = self.total_num_shares.get(
+                project_id, 0
+            ) + (campaign["amount"] / campaign["value_per_share"])
+            self.total_fans_percentage[project_id] = (
+                self.total_fans_percentage.get(project_id, 0)
+                + campaign["fans_percentage"]
+            )
+            ended = campaign["end_datetime"] and campaign["end_datetime"] <= now
+            if campaign["start_datetime"] <= now and not ended:
+                self.active_project_ids.add(project_id)
+
+    def percentage(self, project_id, num_shares):
+        return (
+            float(num_shares) / self.total_num_shares[project_id]
+        ) * self.total_fans_percentage[project_id]
+
+    def investor_percentages(self, investor_project_shares):
+        """
+        Sum the ownership of active projects for shares keyed by (user ID, project ID)
+        """
+        percentages = {}
+        for (user_id, project_id), num_shares in investor_project_shares.items():
+            if project_id in self.active_project_ids:
+                percentages[user_id] = percentages.get(user_id, 0) + self.percentage(
+                    project_id, num_shares
+                )
+        return percentages
+
+
+class ProjectQuerySet(models.QuerySet):
+    def ownership(self):
+        from campaign.models import Campaign
+
+        return ProjectOwnership(
+            Campaign.objects.filter(project__in=self).values(
+                "project",
+                "amount",
+                "value_per_share",
+                "fans_percentage",
+                "start_datetime",
+                "end_datetime",
+            )
+        )
+
+    def investor_project_shares(self):
+        """
+        Total shares and investment of each investor in each project
+        """
+        from campaign.models import Investment
+
+        return (
+            Investment.objects.filter(
+                campaign__project__in=self, charge__paid=True, charge__refunded=False
+            )
+            .values(
+                project_id=models.F("campaign__project"),
+                user_id=models.F("charge__customer__user"),
+            )
+            .annotate(
+                total_num_shares=models.Sum("num_shares"),
+                total_investment=models.Sum(
+                    models.F("num_shares") * models.F("campaign__value_per_share"),
+                    output_field=models.IntegerField(),
+                ),
+            )
+            .order_by()
+        )
+
+    def investors(self):
+        from accounts.models import UserProfile
+
+        project_investments = self.investor_project_shares()
+        user_profiles = UserProfile.objects.filter(
+            user__in={investment["user_id"] for investment in project_investments}
+        ).select_related("user", "avatar__useravatarurl", "avatar__useravatarimage")
+        user_profiles = {
+            user_profile.user_id: user_profile for user_profile in user_profiles
+        }
+
+        investors = {}
+        investor_project_shares = {}
+        for investment in project_investments:
+            user_id = investment["user_id"]
+            if user_id not in investors:
+                user_profile = user_profiles[user_id]
+                investors[user_id] = {
+                    "name": user_profile.get_display_name(),
+                    "avatar_url": user_profile.display_avatar_url(),
+                    "public_profile_url": user_profile.public_profile_url(),
+                    "num_shares": 0,
+                    "total_investment": 0,
+                }
+            investors[user_id]["num_shares"] += investment["total_num_shares"]
+            investors[user_id]["total_investment"] += investment["total_investment"]
+            investor_project_shares[user_id, investment["project_id"]] = investment[
+                "total_num_shares"
+            ]
+
+        # Calculate percentage ownership for each investor (if any project is active)
+        ownership = self.ownership()
+        if ownership.active_project_ids:
+            percentages = ownership.investor_percentages(investor_project_shares)
+            for user_id, investor in investors.items():
+                investor["percentage"] = percentages.get(user_id, 0)
+
+        return investors
+
+
+class CampaignQuerySet(models.QuerySet):
+    def annotate_shares_purchased(self):
+        return self.annotate(
+            shares_purchased=Coalesce("campaignfundingstats__shares_purchased", 0)
+        )
+
+    def annotate_percentage_funded(self):
+        # Mirror Campaign.percentage_funded() and Campaign.funded_rounding()
+        # so that the database and Python agree on every campaign
+        unrounded_funded = models.ExpressionWrapper(
+            Cast(
+                models.ExpressionWrapper(
+                    models.F("shares_purchased") * models.F("value_per_share"),
+                    output_field=models.IntegerField(),
+                ),
+                models.FloatField(),
+            )
+            / NullIf("amount", 0)
+            * 100,
+            output_field=models.FloatField(),
+        )
+        return (
+            self.annotate_shares_purchased()
+            .annotate(unrounded_funded=unrounded_funded)
+            .annotate(
+                funded=models.Case(
+                    models.When(amount=0, then=models.Value(100)),
+                    models.When(
+                        unrounded_funded__lt=99,
+                        then=Cast(Ceil("unrounded_funded"), models.IntegerField()),
+                    ),
+                    default=Cast(Floor("unrounded_funded"), models.IntegerField()),
+                    output_field=models.IntegerField(),
+                )
+            )
+        )
+
+
+class CampaignFundingStatsManager(models.Manager):
+
+    EMPTY_STATS = {
+        "shares_purchased": 0,
+        "amount_raised": 0,
+        "num_investors": 0,
+        "last_investment_datetime": None,
+    }
+
+    def calculate(self, campaigns=None):
+        """
+        Aggregate live funding stats from paid, unrefunded investments, keyed by campaign ID
+        """
+        from campaign.models import Investment
+
+        investments = Investment.objects.filter(
+            charge__paid=True, charge__refunded=False
+        )
+        if campaigns is not None:
+            investments = investments.filter(campaign__in=campaigns)
+        campaign_stats = (
+            investments.values("campaign")
+            .annotate(
+                shares_purchased=models.Sum("num_shares"),
+                amount_raised=models.Sum(
+                    models.F("num_shares") * models.F("campaign__value_per_share"),
+                    output_field=models.IntegerField(),
+                ),
+                num_investors=models.Count("charge__customer__user", distinct=True),
+                last_investment_datetime=models.Max("transaction_datetime"),
+            )
+            .order_by()
+        )
+        return {stats.pop("campaign"): stats for stats in campaign_stats}
+
+    def refresh(self, campaign):
+        stats = self.calculate(campaigns=[campaign]).get(campaign.id, {})
+        funding_stats, _ = self.update_or_create(
+            campaign=campaign, defaults={**self.EMPTY_STATS, **stats}
+        )
+        campaign.campaignfundingstats = funding_stats
+        return funding_stats
+
+    def refresh_existing(self, campaign_id):
+        """
+        Recalculate the stored funding stats of a campaign, without creating them if missing
+        """
+        stats = self.calculate(campaigns=[campaign_id]).get(campaign_id, {})
+        return self.filter(campaign_id=campaign_id).update(
+            **{**self.EMPTY_STATS, **stats}
+        )
+
+    def rebuild(self):
+        with transaction.atomic():
+            self.all().delete()
+            campaign_stats = self.calculate()
+            return self.bulk_create(
+                self.model(campaign_id=campaign_id, **stats)
+                for campaign_id, stats in campaign_stats.items()
+            )
+
+    def verify(self):
+        """
+        Return the IDs of campaigns whose stored funding stats disagree with live aggregates
+        """
+        live_stats = self.calculate()
+        stored_stats = {
+            stats.pop("campaign"): stats
+            for stats in self.values("campaign", *self.EMPTY_STATS)
+        }
+        return sorted(
+            campaign_id
+            for campaign_id in set(live_stats) | set(stored_stats)
+            if live_stats.get(campaign_id, self.EMPTY_STATS)
+            != stored_stats.get(campaign_id, self.EMPTY_STATS)
+        )
 
 
 class InvestmentManager(models.Manager):
@@ -6,3 +244,67 @@ class InvestmentManager(models.Manager):
         return self.filter(
             charge__customer__user=user, charge__paid=True, charge__refunded=False
         )
+
+
+class LeaderboardEntryManager(models.Manager):
+    def top(self, num_entries=20):
+        return (
+            self.filter(amount__gt=0, user__userprofile__invest_anonymously=False)
+            .select_related(
+                "user__userprofile__avatar__useravatarurl",
+                "user__userprofile__avatar__useravatarimage",
+            )
+            .order_by("-amount")[:num_entries]
+        )
+
+    def affected_user_ids(self, since):
+        """
+        Find investors with new investments or new revenue reports on their projects
+        """
+        from campaign.models import Investment
+
+        investments = Investment.objects.filter(
+            models.Q(transaction_datetime__gt=since)
+            | models.Q(campaign__project__revenuereport__reported_datetime__gt=since)
+        )
+        return set(investments.values_list("charge__customer__user", flat=True))
+
+    def refresh(self, user_ids=None):
+        """
+        Recalculate the total earned by the given investors (all investors if None)
+        """
+        from campaign.models import Investment
+        from campaign.revenue import RevenueAttribution
+
+        investments = Investment.objects.filter(
+            charge__paid=True, charge__refunded=False
+        )
+        if user_ids is not None:
+            investments = investments.filter(charge__customer__user__in=user_ids)
+        attribution = RevenueAttribution(investments)
+        user_revenue = attribution.user_revenue()
+
+        # Entries are stamped with the newest investment or revenue report that
+        # was read, not the current time, so anything saved while the refresh
+        # was running is still newer than the watermark of the next refresh
+        refreshed_datetime = attribution.latest_datetime
+
+        with transaction.atomic():
+            entries = self.all()
+            if user_ids is not None:
+                entries = entries.filter(user__in=user_ids)
+            entries.delete()
+            return self.bulk_create(
+                self.model(
+                    user_id=user_id,
+                    amount=amount,
+                    refreshed_datetime=refreshed_datetime,
+                )
+                for user_id, amount in user_revenue.items()
+            )
+
+    def refresh_incremental(self):
+        since = self.aggregate(since=models.Max("refreshed_datetime"))["since"]
+        if since is None:
+            return self.refresh()
+        return self.refresh(user_ids=self.affected_user_ids(since))
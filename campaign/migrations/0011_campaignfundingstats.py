@@ -0,0 +1,64 @@
+# Generated by Django 2.2.14 on 2026-10-18 02:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("campaign", "0010_auto_20160625_0134")]
+
+    def create_campaign_funding_stats(apps, schema_editor):
+        Investment = apps.get_model("campaign", "Investment")
+        CampaignFundingStats = apps.get_model("campaign", "CampaignFundingStats")
+        campaign_stats = (
+            Investment.objects.filter(charge__paid=True, charge__refunded=False)
+            .values("campaign")
+            .annotate(
+                shares_purchased=models.Sum("num_shares"),
+                amount_raised=models.Sum(
+                    models.F("num_shares") * models.F("campaign__value_per_share"),
+                    output_field=models.IntegerField(),
+                ),
+                num_investors=models.Count("charge__customer__user", distinct=True),
+                last_investment_datetime=models.Max("transaction_datetime"),
+            )
+            .order_by()
+        )
+        CampaignFundingStats.objects.bulk_create(
+            CampaignFundingStats(campaign_id=stats.pop("campaign"), **stats)
+            for stats in campaign_stats
+        )
+
+    operations = [
+        migrations.CreateModel(
+            name="CampaignFundingStats",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shares_purchased", models.PositiveIntegerField(default=0)),
+                ("amount_raised", models.PositiveIntegerField(default=0)),
+                ("num_investors", models.PositiveIntegerField(default=0)),
+                (
+                    "last_investment_datetime",
+                    models.DateTimeField(blank=True, null=True),
+                ),
+                (
+                    "campaign",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="campaign.Campaign",
+                    ),
+                ),
+            ],
+            options={"verbose_name_plural": "Campaign funding stats"},
+        ),
+        migrations.RunPython(create_campaign_funding_stats, migrations.RunPython.noop),
+    ]
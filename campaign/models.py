@@ -7,11 +7,18 @@
 import math
 
 from django.conf import settings
+from django.contrib.auth.models import User
 from django.db import models
 from django.utils import timezone
 from pinax.stripe.models import Charge
 
-from campaign.managers import InvestmentManager
+from campaign.managers import (
+    CampaignFundingStatsManager,
+    CampaignQuerySet,
+    InvestmentManager,
+    LeaderboardEntryManager,
+    ProjectQuerySet,
+)
 
 
 class Project(models.Model):
@@ -22,6 +29,8 @@ class Project(models.Model):
         help_text="The reason why the artist is raising money, in a few words",
     )
 
+    objects = ProjectQuerySet.as_manager()
+
     def __str__(self):
         return "{artist} project {reason}".format(
             artist=str(self.artist), reason=self.reason
@@ -75,20 +84,8 @@ class Project(models.Model):
             float(self.total_fans_percentage()) / 100
         )
 
-    def project_investors(self, investors=None):
-        investors = investors or {}
-        for campaign in self.campaign_set.all():
-            investors = campaign.campaign_investors(investors=investors)
-
-        # Calculate percentage ownership for each investor (if project is active)
-        if self.active():
-            for investor_id, investor in investors.items():
-                percentage = (
-                    float(investor["num_shares"]) / self.total_num_shares()
-                ) * self.total_fans_percentage()
-                investors[investor_id]["percentage"] = percentage
-
-        return investors
+    def project_investors(self):
+        return Project.objects.filter(id=self.id).investors()
 
 
 class Campaign(models.Model):
@@ -119,6 +116,8 @@ class Campaign(models.Model):
         help_text="The percentage of revenue that goes back to the fans (a value from 0-100)"
     )
 
+    objects = CampaignQuerySet.as_manager()
+
     @staticmethod
     def funded_rounding(n):
         if n < 99:
@@ -146,13 +145,14 @@ class Campaign(models.Model):
     def num_shares(self):
         return self.amount / self.value_per_share
 
+    def funding_stats(self):
+        try:
+            return self.campaignfundingstats
+        except CampaignFundingStats.DoesNotExist:
+            return CampaignFundingStats(campaign_id=self.id)
+
     def total_shares_purchased(self):
-        return (
-            self.investment_set.filter(
-                charge__paid=True, charge__refunded=False
-            ).aggregate(total_shares=models.Sum("num_shares"))["total_shares"]
-            or 0
-        )
+        return self.funding_stats().shares_purchased
 
     def num_shares_remaining(self):
         return self.num_shares() - self.total_shares_purchased()
@@ -162,7 +162,7 @@ class Campaign(models.Model):
         return min(default_num, self.num_shares_remaining())
 
     def amount_raised(self):
-        return self.total_shares_purchased() * self.value_per_share
+        return self.funding_stats().amount_raised
 
     def percentage_funded(self):
         try:
@@ -185,28 +185,22 @@ class Campaign(models.Model):
         ended = self.end_datetime and self.end_datetime < timezone.now()
         return started and not ended and self.amount_raised() < self.amount
 
-    def campaign_investors(self, investors=None):
-        investors = investors or {}
-        investments = self.investment_set.filter(
-            charge__paid=True, charge__refunded=False
-        ).select_related("charge", "charge__customer", "charge__customer__user")
-
-        for investment in investments:
-            investor = investment.investor()
-            if investor.id not in investors:
-                investors[investor.id] = {
-                    "name": investor.userprofile.get_display_name(),
-                    "avatar_url": investor.userprofile.display_avatar_url(),
-                    "public_profile_url": investor.userprofile.public_profile_url(),
-                    "num_shares": 0,
-                    "total_investment": 0,
-                }
-            investors[investor.id]["num_shares"] += investment.num_shares
-            investors[investor.id]["total_investment"] += (
-                investment.num_shares * investment.campaign.value_per_share
-            )
 
-        return investors
+class CampaignFundingStats(models.Model):
+
+    campaign = models.OneToOneField(Campaign, on_delete=models.CASCADE)
+    shares_purchased = models.PositiveIntegerField(default=0)
+    amount_raised = models.PositiveIntegerField(default=0)
+    num_investors = models.PositiveIntegerField(default=0)
+    last_investment_datetime = models.DateTimeField(null=True, blank=True)
+
+    objects = CampaignFundingStatsManager()
+
+    class Meta:
+        verbose_name_plural = "Campaign funding stats"
+
+    def __str__(self):
+        return str(self.campaign)
 
 
 class ArtistPercentageBreakdown(models.Model):
@@ -301,3 +295,20 @@ class RevenueReport(models.Model):
         return "${amount} for {project}".format(
             amount=self.amount, project=str(self.project)
         )
+
+
+class LeaderboardEntry(models.Model):
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    amount = models.FloatField(
+        db_index=True, help_text="The total revenue earned by the investor"
+    )
+    refreshed_datetime = models.DateTimeField(db_index=True)
+
+    objects = LeaderboardEntryManager()
+
+    class Meta:
+        verbose_name_plural = "Leaderboard entries"
+
+    def __str__(self):
+        return "{user}: ${amount:.2f}".format(user=str(self.user), amount=self.amount)
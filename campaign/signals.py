@@ -4,46 +4,82 @@
 
 """
 
-from django.core.cache import cache
 from django.db import models
 from django.dispatch import receiver
+from pinax.stripe.webhooks import registry
 
-from accounts.models import UserProfile
-from campaign.models import Investment, RevenueReport
+from campaign.models import (
+    Campaign,
+    CampaignFundingStats,
+    Investment,
+    LeaderboardEntry,
+)
+from campaign.views import leaderboard_cache
 
 
 @receiver(
     models.signals.post_save,
-    sender=Investment,
-    dispatch_uid="clear_leaderboard_from_investment_handler",
+    sender=Campaign,
+    dispatch_uid="refresh_funding_stats_from_campaign_handler",
 )
+def refresh_funding_stats_from_campaign_handler(sender, instance, **kwargs):
+    CampaignFundingStats.objects.refresh(instance)
+
+
 @receiver(
     models.signals.post_save,
-    sender=RevenueReport,
-    dispatch_uid="clear_leaderboard_from_revenue_report_handler",
+    sender=Investment,
+    dispatch_uid="refresh_funding_stats_from_investment_handler",
 )
-def clear_leaderboard_cache_handler(sender, instance, **kwargs):
-    cache.delete("leaderboard")
+def refresh_funding_stats_from_investment_handler(sender, instance, **kwargs):
+    CampaignFundingStats.objects.refresh(instance.campaign)
 
 
 @receiver(
-    models.signals.post_save,
+    models.signals.post_delete,
     sender=Investment,
-    dispatch_uid="clear_profile_contexts_from_investment_handler",
+    dispatch_uid="refresh_funding_stats_from_deleted_investment_handler",
 )
-def clear_profile_context(sender, instance, **kwargs):
-    pk = instance.investor().userprofile.pk
-    cache.delete(f"profile_context-{pk}")
+def refresh_funding_stats_from_deleted_investment_handler(sender, instance, **kwargs):
+    # Deleting a campaign also deletes its investments and funding stats,
+    # so the stats must not be recreated while the campaign is being deleted
+    CampaignFundingStats.objects.refresh_existing(instance.campaign_id)
 
 
 @receiver(
-    models.signals.post_save,
-    sender=RevenueReport,
-    dispatch_uid="clear_profile_contexts_from_revenue_report_handler",
-)
-def clear_all_profile_contexts(sender, instance, **kwargs):
-    # TODO(lucas): Review to improve performance
-    # Instead of clearing out all of the profile contexts, we could just clear out
-    # the profile contexts associated with the investors related to this revenue report
-    cache_keys = [f"profile_context-{up.pk}" for up in UserProfile.objects.all()]
-    cache.delete_many(cache_keys)
+    registry.get_signal("charge.succeeded"),
+    dispatch_uid="refresh_funding_stats_from_charge_succeeded_handler",
+)
+@receiver(
+    registry.get_signal("charge.failed"),
+    dispatch_uid="refresh_funding_stats_from_charge_failed_handler",
+)
+@receiver(
+    registry.get_signal("charge.refunded"),
+    dispatch_uid="refresh_funding_stats_from_charge_refunded_handler",
+)
+def refresh_funding_stats_from_charge_handler(sender, **kwargs):
+    # The webhook has already synced the charge, so its paid and refunded
+    # statuses are current when the stats are recalculated
+    charge_id = kwargs["event"].message["data"]["object"]["id"]
+    investments = Investment.objects.filter(charge__stripe_id=charge_id)
+    for investment in investments.select_related("campaign"):
+        CampaignFundingStats.objects.refresh(investment.campaign)
+
+
+@receiver(
+    registry.get_signal("charge.refunded"),
+    dispatch_uid="refresh_leaderboard_from_charge_refunded_handler",
+)
+def refresh_leaderboard_from_charge_refunded_handler(sender, **kwargs):
+    # Refunds don't create new investments or revenue reports,
+    # so incremental leaderboard refreshes would never pick them up
+    charge_id = kwargs["event"].message["data"]["object"]["id"]
+    user_ids = set(
+        Investment.objects.filter(charge__stripe_id=charge_id).values_list(
+            "charge__customer__user", flat=True
+        )
+    )
+    if user_ids:
+        LeaderboardEntry.objects.refresh(user_ids=user_ids)
+        leaderboard_cache.rebuild()
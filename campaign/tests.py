@@ -5,19 +5,37 @@
 """
 
 import datetime
+from io import StringIO
+from unittest import mock
 
 import factory
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
+from django.utils import timezone
+from pinax.stripe.webhooks import registry
 from pigeon.test import RenderTestCase
 
 from artist.factories import ArtistFactory
 from campaign.factories import (
     CampaignFactory,
+    ChargeFactory,
+    CustomerFactory,
+    InvestmentFactory,
     ProjectFactory,
     RevenueReportFactory,
     campaignfactory_factory,
     revenuereportfactory_factory,
 )
+from campaign.models import (
+    CampaignFundingStats,
+    Investment,
+    LeaderboardEntry,
+    Project,
+    RevenueReport,
+)
+from campaign.revenue import RevenueAttribution
+from campaign.views import LeaderboardView
 from perdiem.tests import MigrationTestCase, PerDiemTestCase
 
 
@@ -83,6 +101,32 @@ class PointArtistPercentageBreakdownsAndRevenueReportsToProjectsMigrationTestCas
         self.assertEqual(self.revenue_report.project.id, campaign.project.id)
 
 
+class CreateCampaignFundingStatsMigrationTestCase(MigrationTestCase):
+
+    migrate_from = "0010_auto_20160625_0134"
+    migrate_to = "0011_campaignfundingstats"
+
+    def setUpBeforeMigration(self, apps):
+        CampaignFactoryForMigrationTestCase = campaignfactory_factory(apps=apps)
+        Investment = apps.get_model("campaign", "Investment")
+
+        # Create a campaign with one paid and one refunded investment
+        self.campaign = CampaignFactoryForMigrationTestCase(value_per_share=2)
+        customer = CustomerFactory()
+        for refunded in (False, True):
+            charge = ChargeFactory(customer=customer, refunded=refunded)
+            Investment.objects.create(
+                charge_id=charge.id, campaign=self.campaign, num_shares=5
+            )
+
+    def testFundingStatsCreatedFromInvestments(self):
+        CampaignFundingStats = self.apps.get_model("campaign", "CampaignFundingStats")
+        funding_stats = CampaignFundingStats.objects.get(campaign_id=self.campaign.id)
+        self.assertEqual(funding_stats.shares_purchased, 5)
+        self.assertEqual(funding_stats.amount_raised, 10)
+        self.assertEqual(funding_stats.num_investors, 1)
+
+
 class CampaignModelTestCase(TestCase):
     def testProjectGeneratedRevenue(self):
         # Generate campaign and revenue report
@@ -97,6 +141,193 @@ class CampaignModelTestCase(TestCase):
         campaign = CampaignFactory(amount=0)
         self.assertEqual(campaign.percentage_funded(), 100)
 
+    def testRevenueAttributionMatchesGeneratedRevenue(self):
+        now = timezone.now()
+        campaigns = [
+            CampaignFactory(amount=1000, fans_percentage=15),
+            CampaignFactory(amount=333, value_per_share=3, fans_percentage=7),
+        ]
+        customer = CustomerFactory()
+        for days_ago, campaign, num_shares in (
+            (30, campaigns[0], 7),
+            (20, campaigns[0], 13),
+            (10, campaigns[1], 11),
+            (5, campaigns[0], 1),
+        ):
+            investment = InvestmentFactory(
+                charge__customer=customer, campaign=campaign, num_shares=num_shares
+            )
+            Investment.objects.filter(id=investment.id).update(
+                transaction_datetime=now - datetime.timedelta(days=days_ago)
+            )
+        InvestmentFactory(campaign=campaigns[1], num_shares=17)
+
+        # Report revenue before, between, at the same time as and after the investments
+        for days_ago, campaign, amount in (
+            (40, campaigns[0], "10.01"),
+            (25, campaigns[0], "123.45"),
+            (20, campaigns[0], "99.99"),
+            (15, campaigns[1], "0.07"),
+            (1, campaigns[1], "1234.56"),
+            (1, campaigns[0], "0.33"),
+        ):
+            revenue_report = RevenueReportFactory(
+                project=campaign.project, amount=amount
+            )
+            RevenueReport.objects.filter(id=revenue_report.id).update(
+                reported_datetime=now - datetime.timedelta(days=days_ago)
+            )
+
+        # Verify that all investments are attributed revenue in two queries
+        paid_investments = Investment.objects.filter(
+            charge__paid=True, charge__refunded=False
+        )
+        with self.assertNumQueries(2):
+            revenue_attribution = RevenueAttribution(paid_investments)
+
+        # Verify that the results are identical to the per-investment calculation
+        investment_revenue = revenue_attribution.investment_revenue()
+        for investment in paid_investments:
+            self.assertEqual(
+                investment_revenue[investment.id], investment.generated_revenue()
+            )
+        user_revenue = revenue_attribution.user_revenue()
+        self.assertAlmostEqual(
+            user_revenue[customer.user.id],
+            sum(
+                investment.generated_revenue()
+                for investment in paid_investments.filter(charge__customer=customer)
+            ),
+        )
+        self.assertAlmostEqual(
+            customer.user.userprofile.get_total_earned(),
+            user_revenue[customer.user.id],
+        )
+        artist_revenue = revenue_attribution.artist_revenue()
+        for campaign in campaigns:
+            self.assertAlmostEqual(
+                artist_revenue[campaign.project.artist.id],
+                sum(
+                    investment.generated_revenue()
+                    for investment in paid_investments.filter(campaign=campaign)
+                ),
+            )
+
+    def testProjectOwnershipMatchesProjectTotals(self):
+        # Create a project with two campaigns and an inactive project
+        campaign = CampaignFactory(amount=1000, fans_percentage=20)
+        project = campaign.project
+        CampaignFactory(project=project, amount=500, value_per_share=5)
+        inactive_campaign = CampaignFactory(
+            start_datetime=timezone.now() + datetime.timedelta(days=1)
+        )
+        for _ in range(3):
+            InvestmentFactory(campaign=campaign, num_shares=10)
+        InvestmentFactory(campaign=inactive_campaign)
+
+        # Verify that the ownership of all investors is calculated in two queries
+        projects = Project.objects.filter(
+            id__in=[project.id, inactive_campaign.project.id]
+        )
+        with self.assertNumQueries(2):
+            ownership = projects.ownership()
+            investor_project_shares = {
+                (investment["user_id"], investment["project_id"]): investment[
+                    "total_num_shares"
+                ]
+                for investment in projects.investor_project_shares()
+            }
+            percentages = ownership.investor_percentages(investor_project_shares)
+
+        self.assertEqual(ownership.active_project_ids, {project.id})
+        self.assertEqual(len(percentages), 3)
+        expected_percentage = (
+            10.0 / project.total_num_shares()
+        ) * project.total_fans_percentage()
+        for percentage in percentages.values():
+            self.assertAlmostEqual(percentage, expected_percentage)
+
+        # Verify that the project investors share the same percentages
+        for investor in project.project_investors().values():
+            self.assertAlmostEqual(investor["percentage"], expected_percentage)
+
+
+class CampaignFundingStatsTestCase(TestCase):
+    def testFundingStatsUpdatedFromInvestments(self):
+        campaign = CampaignFactory(amount=100, value_per_share=2)
+        self.assertEqual(campaign.percentage_funded(), 0)
+
+        # Two investments are made and one is refunded
+        investment = InvestmentFactory(campaign=campaign, num_shares=5)
+        InvestmentFactory(campaign=campaign, num_shares=10)
+        InvestmentFactory(campaign=campaign, num_shares=20, charge__refunded=True)
+
+        # Verify that only paid, unrefunded investments count towards funding
+        funding_stats = campaign.funding_stats()
+        self.assertEqual(funding_stats.shares_purchased, 15)
+        self.assertEqual(funding_stats.amount_raised, 30)
+        self.assertEqual(funding_stats.num_investors, 2)
+        self.assertEqual(campaign.percentage_funded(), 30)
+        self.assertEqual(campaign.num_shares_remaining(), 35)
+
+        # Verify that a later investment in the same campaign is counted
+        investment.num_shares = 10
+        investment.save()
+        self.assertEqual(campaign.total_shares_purchased(), 20)
+
+    def testFundingStatsUpdatedFromDeletedInvestments(self):
+        investment = InvestmentFactory(num_shares=5)
+        campaign = investment.campaign
+        InvestmentFactory(campaign=campaign, num_shares=10)
+
+        # Verify that a deleted investment no longer counts towards funding
+        investment.delete()
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.total_shares_purchased(), 10)
+        self.assertEqual(CampaignFundingStats.objects.verify(), [])
+
+        # Verify that deleting the campaign with its investments deletes its stats
+        campaign_id = campaign.id
+        campaign.delete()
+        self.assertFalse(
+            CampaignFundingStats.objects.filter(campaign_id=campaign_id).exists()
+        )
+
+    def testFundingStatsUpdatedFromRefundWebhook(self):
+        investment = InvestmentFactory(num_shares=5)
+        campaign = investment.campaign
+        self.assertEqual(campaign.total_shares_purchased(), 5)
+
+        # The charge is refunded and Stripe notifies us with a webhook
+        charge = investment.charge
+        charge.refunded = True
+        charge.save()
+        event = mock.Mock(message={"data": {"object": {"id": charge.stripe_id}}})
+        registry.get_signal("charge.refunded").send(sender=None, event=event)
+
+        # Verify that the refunded shares no longer count towards funding
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.total_shares_purchased(), 0)
+
+    def testRebuildFundingStats(self):
+        investment = InvestmentFactory(num_shares=5)
+        campaign_id = investment.campaign.id
+
+        # Verification fails when the stored stats have drifted
+        CampaignFundingStats.objects.filter(campaign_id=campaign_id).update(
+            shares_purchased=0
+        )
+        with self.assertRaisesMessage(CommandError, str(campaign_id)):
+            call_command("rebuild_funding_stats", "--verify-only", stdout=StringIO())
+
+        # Rebuilding the stats from scratch fixes them
+        call_command("rebuild_funding_stats", stdout=StringIO())
+        self.assertEqual(CampaignFundingStats.objects.verify(), [])
+        self.assertEqual(
+            CampaignFundingStats.objects.get(campaign_id=campaign_id).shares_purchased,
+            5,
+        )
+
 
 class CampaignAdminWebTestCase(PerDiemTestCase):
     @classmethod
@@ -176,3 +407,112 @@ class CampaignAdminWebTestCase(PerDiemTestCase):
 class CampaignWebTestCase(PerDiemTestCase):
     def get200s(self):
         return ["/stats/"]
+
+    def testLeaderboardOrdersInvestorsByEarnings(self):
+        campaign = CampaignFactory(amount=1000)
+        for num_shares in (10, 30, 20):
+            InvestmentFactory(campaign=campaign, num_shares=num_shares)
+        anonymous_investment = InvestmentFactory(campaign=campaign, num_shares=40)
+        anonymous_investor = anonymous_investment.investor().userprofile
+        anonymous_investor.invest_anonymously = True
+        anonymous_investor.save()
+        RevenueReportFactory(project=campaign.project, amount=1000)
+        call_command("refresh_leaderboard", stdout=StringIO())
+
+        # Verify that the top investors are read in a single query
+        with self.assertNumQueries(1):
+            leaderboard = LeaderboardView.calculate_leaderboard()
+        self.assertEqual([leader["amount"] for leader in leaderboard], [6.0, 4.0, 2.0])
+
+        response = self.assertResponseRenders("/stats/")
+        self.assertEqual(response.context["top_earned_investors"], leaderboard)
+
+    def testRefreshLeaderboardOnlyUpdatesAffectedInvestors(self):
+        campaign = CampaignFactory(amount=1000)
+        other_campaign = CampaignFactory(amount=1000)
+        investment = InvestmentFactory(campaign=campaign, num_shares=10)
+        other_investment = InvestmentFactory(campaign=other_campaign, num_shares=10)
+        RevenueReportFactory(project=campaign.project, amount=1000)
+        call_command("refresh_leaderboard", stdout=StringIO())
+        self.assertEqual(LeaderboardEntry.objects.count(), 2)
+        other_entry = LeaderboardEntry.objects.get(user=other_investment.investor())
+
+        # New revenue only refreshes the investors in that project
+        RevenueReportFactory(project=campaign.project, amount=500)
+        stdout = StringIO()
+        call_command("refresh_leaderboard", stdout=stdout)
+        self.assertIn("for 1 investors", stdout.getvalue())
+        self.assertEqual(
+            LeaderboardEntry.objects.get(user=investment.investor()).amount, 3.0
+        )
+        self.assertEqual(
+            LeaderboardEntry.objects.get(user=other_investment.investor()),
+            other_entry,
+        )
+
+        # New investments refresh their investors, even before they have earned anything
+        new_investment = InvestmentFactory(campaign=other_campaign)
+        stdout = StringIO()
+        call_command("refresh_leaderboard", stdout=stdout)
+        self.assertIn("for 1 investors", stdout.getvalue())
+        self.assertEqual(
+            LeaderboardEntry.objects.get(user=new_investment.investor()).amount, 0
+        )
+
+        # A full refresh recalculates every investor
+        stdout = StringIO()
+        call_command("refresh_leaderboard", "--full", stdout=stdout)
+        self.assertIn("for 3 investors", stdout.getvalue())
+
+    def testRefreshLeaderboardWatermarkComesFromData(self):
+        campaign = CampaignFactory(amount=1000)
+        InvestmentFactory(campaign=campaign, num_shares=10)
+        revenue_report = RevenueReportFactory(project=campaign.project, amount=1000)
+        call_command("refresh_leaderboard", stdout=StringIO())
+        self.assertEqual(
+            LeaderboardEntry.objects.get().refreshed_datetime,
+            revenue_report.reported_datetime,
+        )
+
+        # An investment committed while the refresh was running, made after
+        # everything the refresh read, is picked up by the next refresh
+        late_investment = InvestmentFactory(campaign=campaign)
+        Investment.objects.filter(pk=late_investment.pk).update(
+            transaction_datetime=revenue_report.reported_datetime
+            + datetime.timedelta(microseconds=1)
+        )
+        stdout = StringIO()
+        call_command("refresh_leaderboard", stdout=stdout)
+        self.assertIn("for 1 investors", stdout.getvalue())
+        self.assertTrue(
+            LeaderboardEntry.objects.filter(user=late_investment.investor()).exists()
+        )
+
+    def testLeaderboardUpdatedFromRefundWebhook(self):
+        campaign = CampaignFactory(amount=1000)
+        investment = InvestmentFactory(campaign=campaign, num_shares=10)
+        other_investment = InvestmentFactory(campaign=campaign, num_shares=10)
+        RevenueReportFactory(project=campaign.project, amount=1000)
+        call_command("refresh_leaderboard", stdout=StringIO())
+        other_entry = LeaderboardEntry.objects.get(user=other_investment.investor())
+
+        # The charge is refunded and Stripe notifies us with a webhook
+        charge = investment.charge
+        charge.refunded = True
+        charge.save()
+        event = mock.Mock(message={"data": {"object": {"id": charge.stripe_id}}})
+        registry.get_signal("charge.refunded").send(sender=None, event=event)
+
+        # Verify that the refunded investor is removed from the leaderboard
+        # without waiting for a full refresh
+        self.assertFalse(
+            LeaderboardEntry.objects.filter(user=investment.investor()).exists()
+        )
+        self.assertEqual(
+            LeaderboardEntry.objects.get(user=other_investment.investor()),
+            other_entry,
+        )
+        self.assertEqual(
+            [leader["amount"] for leader in LeaderboardView.calculate_leaderboard()],
+            [2.0],
+        )
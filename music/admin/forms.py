@@ -8,7 +8,8 @@ from django import forms
 from django.core.exceptions import ObjectDoesNotExist
 from pagedown.widgets import AdminPagedownWidget
 
-from music.models import ActivityEstimate, AlbumBio, Track
+from artist.models import Artist
+from music.models import ActivityEstimate, Album, AlbumBio, Track
 
 
 class AlbumBioAdminForm(forms.ModelForm):
@@ -59,6 +60,23 @@ class ActivityEstimateAdminForm(forms.ModelForm):
         return cleaned_data
 
 
+class DailyReportFilterForm(forms.Form):
+
+    date = forms.DateField(
+        required=False, help_text="The date to enter activity estimates for"
+    )
+    artist = forms.ModelChoiceField(queryset=Artist.objects.all(), required=False)
+    album = forms.ModelChoiceField(queryset=Album.objects.all(), required=False)
+    missing = forms.BooleanField(
+        required=False, label="Only tracks without estimates for the date"
+    )
+    after = forms.ModelChoiceField(
+        queryset=Track.objects.select_related("album__project__artist"),
+        required=False,
+        widget=forms.HiddenInput(),
+    )
+
+
 class DailyReportForm(forms.Form):
 
     track = forms.ModelChoiceField(
@@ -66,3 +84,11 @@ class DailyReportForm(forms.Form):
     )
     streams = forms.IntegerField(min_value=0)
     downloads = forms.IntegerField(min_value=0)
+
+
+class ImportActivityForm(forms.Form):
+
+    report = forms.FileField(
+        help_text="A distributor CSV report with date, streams and downloads columns, "
+        "and isrc or artist and track columns"
+    )
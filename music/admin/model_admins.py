@@ -8,7 +8,7 @@ from django.conf.urls import url
 from django.contrib import admin
 
 from music.admin.forms import ActivityEstimateAdminForm, AlbumBioAdminForm
-from music.admin.views import DailyReportAdminView
+from music.admin.views import DailyReportAdminView, ImportActivityAdminView
 from music.models import AlbumBio, Artwork, Audio, MarketplaceURL, Track
 
 
@@ -64,6 +64,11 @@ class ActivityEstimateAdmin(admin.ModelAdmin):
                 r"^daily-report/?$",
                 admin.site.admin_view(DailyReportAdminView.as_view()),
                 name="daily_report",
-            )
+            ),
+            url(
+                r"^import-activity/?$",
+                admin.site.admin_view(ImportActivityAdminView.as_view()),
+                name="import_activity",
+            ),
         ]
         return custom_urls + urls
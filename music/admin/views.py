@@ -4,10 +4,23 @@
 
 """
 
+import csv
+import io
+
 from django.contrib import messages
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.views.generic.edit import FormView
 
-from music.admin.forms import DailyReportForm
+from music.admin.forms import (
+    DailyReportFilterForm,
+    DailyReportForm,
+    ImportActivityForm,
+)
+from music.importer import ActivityImporter
 from music.models import ActivityEstimate, Track
 from perdiem.views import FormsetView
 
@@ -16,8 +29,71 @@ class DailyReportAdminView(FormsetView):
 
     template_name = "admin/music/activityestimate/daily-report.html"
     form_class = DailyReportForm
+    page_size = 50
+
+    @cached_property
+    def filter_form(self):
+        filter_form = DailyReportFilterForm(self.request.GET)
+        filter_form.is_valid()
+        return filter_form
+
+    @cached_property
+    def report_date(self):
+        return self.filter_form.cleaned_data.get("date") or timezone.localdate()
+
+    @cached_property
+    def tracks(self):
+        """
+        Get the tracks on this page of the report (and one more if there is a next page)
+        """
+        filters = self.filter_form.cleaned_data
+        tracks = Track.objects.select_related("album__project__artist").order_by(
+            "album__project__artist__name", "name", "id"
+        )
+        if filters.get("artist"):
+            tracks = tracks.filter(album__project__artist=filters["artist"])
+        if filters.get("album"):
+            tracks = tracks.filter(album=filters["album"])
+        if filters.get("missing"):
+            tracks = tracks.exclude(
+                id__in=ActivityEstimate.objects.filter(
+                    date=self.report_date,
+                    content_type=ContentType.objects.get_for_model(Track),
+                ).values("object_id")
+            )
+
+        # Continue after the last track of the previous page
+        after = filters.get("after")
+        if after:
+            artist_name = after.album.project.artist.name
+            tracks = tracks.filter(
+                models.Q(album__project__artist__name__gt=artist_name)
+                | models.Q(
+                    album__project__artist__name=artist_name, name__gt=after.name
+                )
+                | models.Q(
+                    album__project__artist__name=artist_name,
+                    name=after.name,
+                    id__gt=after.id,
+                )
+            )
+
+        return list(tracks[: self.page_size + 1])
+
+    def page_tracks(self):
+        return self.tracks[: self.page_size]
+
+    def has_next_page(self):
+        return len(self.tracks) > self.page_size
+
+    def next_page_url(self):
+        query = self.request.GET.copy()
+        query["after"] = self.page_tracks()[-1].id
+        return "{path}?{query}".format(path=self.request.path, query=query.urlencode())
 
     def get_success_url(self):
+        if self.has_next_page():
+            return self.next_page_url()
         return reverse("admin:music_activityestimate_changelist")
 
     def get_context_data(self, **kwargs):
@@ -26,12 +102,15 @@ class DailyReportAdminView(FormsetView):
             {
                 "title": "Enter Daily Report",
                 "has_permission": self.request.user.is_superuser,
+                "filter_form": self.filter_form,
+                "report_date": self.report_date,
+                "next_page_url": self.next_page_url() if self.has_next_page() else None,
             }
         )
         return context
 
     def get_formset_factory_kwargs(self):
-        num_tracks = Track.objects.all().count()
+        num_tracks = len(self.page_tracks())
         return {
             "min_num": num_tracks,
             "max_num": num_tracks,
@@ -40,28 +119,73 @@ class DailyReportAdminView(FormsetView):
         }
 
     def get_initial(self):
-        tracks = Track.objects.all().order_by("album__project__artist__name", "name")
-        return [{"track": track} for track in tracks]
+        return [{"track": track} for track in self.page_tracks()]
 
     def formset_valid(self, formset):
+        # Every estimate is for a track, so the content type is resolved once
+        track_content_type = ContentType.objects.get_for_model(Track)
+        date = self.report_date
+        activity_estimates = []
         for form in formset:
             d = form.cleaned_data
-            track = d["track"]
-            num_streams = d["streams"]
-            num_downloads = d["downloads"]
-
-            if num_streams:
-                ActivityEstimate.objects.create(
-                    activity_type=ActivityEstimate.ACTIVITY_STREAM,
-                    content_object=track,
-                    total=num_streams,
-                )
-            if num_downloads:
-                ActivityEstimate.objects.create(
-                    activity_type=ActivityEstimate.ACTIVITY_DOWNLOAD,
-                    content_object=track,
-                    total=num_downloads,
+            for activity_type, total in (
+                (ActivityEstimate.ACTIVITY_STREAM, d["streams"]),
+                (ActivityEstimate.ACTIVITY_DOWNLOAD, d["downloads"]),
+            ):
+                activity_estimates.append(
+                    ActivityEstimate(
+                        date=date,
+                        activity_type=activity_type,
+                        content_type=track_content_type,
+                        object_id=d["track"].id,
+                        total=total,
+                    )
                 )
+        ActivityEstimate.objects.bulk_upsert(activity_estimates)
 
         messages.success(self.request, "Daily Report was submitted successfully")
         return super().formset_valid(formset)
+
+
+class ImportActivityAdminView(FormView):
+
+    template_name = "admin/music/activityestimate/import-activity.html"
+    form_class = ImportActivityForm
+
+    def get_success_url(self):
+        return reverse("admin:music_activityestimate_changelist")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(
+            {
+                "title": "Import Activity",
+                "has_permission": self.request.user.is_superuser,
+            }
+        )
+        return context
+
+    def form_valid(self, form):
+        importer = ActivityImporter()
+        report = io.TextIOWrapper(
+            form.cleaned_data["report"].file, encoding="utf-8-sig", newline=""
+        )
+        try:
+            # Import all of the report or none of it
+            with transaction.atomic():
+                stats = importer.import_csv(report)
+        except UnicodeDecodeError:
+            form.add_error("report", "The report must be a UTF-8 encoded CSV file.")
+            return self.form_invalid(form)
+        except csv.Error as e:
+            form.add_error(
+                "report",
+                "The report is not a valid CSV file: {error}".format(error=e),
+            )
+            return self.form_invalid(form)
+        messages.success(
+            self.request,
+            "Imported {rows} rows ({skipped_rows} skipped): "
+            "{created} activity estimates created, {updated} updated.".format(**stats),
+        )
+        return super().form_valid(form)
@@ -0,0 +1,151 @@
+import csv
+import datetime
+import itertools
+import time
+
+from django.contrib.contenttypes.models import ContentType
+
+from music.models import ActivityEstimate, Track
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def normalize_name(name):
+    return " ".join(name.casefold().split())
+
+
+def batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class ActivityImporter:
+    """
+    Import streams and downloads from a distributor CSV report
+
+    The report needs date (YYYY-MM-DD), streams and downloads columns, and
+    identifies tracks by isrc, or else by artist and track name. Rows for the
+    same date and track are summed. Rows are streamed through generators and
+    written in batches of batch_size, so memory use only grows with the number
+    of dates and tracks in the report, not its number of rows.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.track_content_type = ContentType.objects.get_for_model(Track)
+        self.tracks_by_isrc = {}
+        self.tracks_by_name = {}
+        for track_id, isrc, name, artist_name in Track.objects.values_list(
+            "id", "isrc", "name", "album__project__artist__name"
+        ):
+            if isrc:
+                self.tracks_by_isrc[isrc.upper()] = track_id
+            self.tracks_by_name[
+                (normalize_name(artist_name), normalize_name(name))
+            ] = track_id
+        self.stats = {
+            "rows": 0,
+            "skipped_rows": 0,
+            "created": 0,
+            "updated": 0,
+            "duration": 0,
+        }
+
+    def find_track_id(self, row):
+        isrc = (row.get("isrc") or "").strip().upper()
+        if isrc in self.tracks_by_isrc:
+            return self.tracks_by_isrc[isrc]
+        return self.tracks_by_name.get(
+            (
+                normalize_name(row.get("artist") or ""),
+                normalize_name(row.get("track") or ""),
+            )
+        )
+
+    def parse_row(self, row):
+        """
+        Get the date, track ID, streams and downloads of a row, or None if the row is invalid
+        """
+        # Short (e.g. truncated) rows have None for their missing fields
+        if None in row.values():
+            return None
+        track_id = self.find_track_id(row)
+        try:
+            date = datetime.date.fromisoformat(row["date"].strip())
+            streams = int(row.get("streams") or 0)
+            downloads = int(row.get("downloads") or 0)
+        except (KeyError, ValueError):
+            return None
+        if track_id is None or streams < 0 or downloads < 0:
+            return None
+        return date, track_id, streams, downloads
+
+    def parse_rows(self, rows):
+        """
+        Yield the date, track ID, streams and downloads of each row, skipping invalid rows
+        """
+        for row in rows:
+            self.stats["rows"] += 1
+            parsed_row = self.parse_row(row)
+            if parsed_row is None:
+                self.stats["skipped_rows"] += 1
+                continue
+            yield parsed_row
+
+    @staticmethod
+    def sum_duplicate_rows(parsed_rows):
+        """
+        Yield each row with the streams and downloads summed over every earlier row for its date and track
+
+        Estimates are upserted with the running totals, so a date and track
+        split over several rows ends with their sum, even across batches.
+        """
+        totals = {}
+        for date, track_id, streams, downloads in parsed_rows:
+            total_streams, total_downloads = totals.get((date, track_id), (0, 0))
+            totals[(date, track_id)] = (
+                total_streams + streams,
+                total_downloads + downloads,
+            )
+            yield (date, track_id, *totals[(date, track_id)])
+
+    def activity_estimates(self, parsed_rows):
+        for date, track_id, streams, downloads in parsed_rows:
+            for activity_type, total in (
+                (ActivityEstimate.ACTIVITY_STREAM, streams),
+                (ActivityEstimate.ACTIVITY_DOWNLOAD, downloads),
+            ):
+                yield ActivityEstimate(
+                    date=date,
+                    activity_type=activity_type,
+                    content_type=self.track_content_type,
+                    object_id=track_id,
+                    total=total,
+                )
+
+    def import_csv(self, csv_file):
+        """
+        Import a report from a text file object, returning the import stats
+        """
+        start = time.monotonic()
+        rows = csv.DictReader(csv_file)
+        if rows.fieldnames:
+            rows.fieldnames = list(map(normalize_name, rows.fieldnames))
+        activity_estimates = self.activity_estimates(
+            self.sum_duplicate_rows(self.parse_rows(rows))
+        )
+        for batch in batched(activity_estimates, self.batch_size):
+            created, updated = ActivityEstimate.objects.bulk_upsert(batch)
+            self.stats["created"] += created
+            self.stats["updated"] += updated
+        self.stats["duration"] += time.monotonic() - start
+        return self.stats
+
+    def rows_per_second(self):
+        if not self.stats["duration"]:
+            return 0
+        return self.stats["rows"] / self.stats["duration"]
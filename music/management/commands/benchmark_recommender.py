@@ -0,0 +1,80 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from music.recommender import ClusterPrunedIndex, ExactIndex, Recommender
+
+
+class Command(BaseCommand):
+
+    help = "Compare the recall@k and latency of cluster-pruned song search against exact search"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--num-queries",
+            type=int,
+            default=200,
+            help="Number of songs from the dataset to search for",
+        )
+        parser.add_argument(
+            "--num-probes",
+            type=int,
+            nargs="+",
+            default=[1, 2, 3, 5],
+            help="Numbers of clusters to probe",
+        )
+        parser.add_argument(
+            "-k", type=int, default=10, help="Number of similar songs to search for"
+        )
+        parser.add_argument(
+            "--artifacts-dir",
+            help="Directory of the recommender artifacts (defaults to settings.RECOMMENDER_ARTIFACTS_DIR)",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for choosing the queries"
+        )
+
+    @staticmethod
+    def search_all(index, queries, k):
+        results, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(index.search(query, k))
+            latencies.append(time.perf_counter() - start)
+        return results, np.array(latencies) * 1000
+
+    def report(self, name, k, latencies, recall):
+        p50, p99 = np.percentile(latencies, [50, 99])
+        self.stdout.write(
+            "{name:<16} recall@{k}={recall:.3f} p50={p50:.3f}ms p99={p99:.3f}ms".format(
+                name=name, k=k, recall=recall, p50=p50, p99=p99
+            )
+        )
+
+    def handle(self, *args, **options):
+        artifacts = Recommender(artifacts_dir=options["artifacts_dir"]).artifacts
+        features = artifacts["features"]
+        k = options["k"]
+        random = np.random.RandomState(options["seed"])
+        rows = random.choice(
+            len(features),
+            size=min(options["num_queries"], len(features)),
+            replace=False,
+        )
+        queries = [np.asarray(features[row]) for row in rows]
+
+        exact_results, exact_latencies = self.search_all(
+            ExactIndex(artifacts), queries, k
+        )
+        self.report("exact", k, exact_latencies, recall=1)
+        for num_probes in options["num_probes"]:
+            index = ClusterPrunedIndex(artifacts, num_probes=num_probes)
+            results, latencies = self.search_all(index, queries, k)
+            recall = np.mean(
+                [
+                    len(np.intersect1d(result, exact_result)) / len(exact_result)
+                    for result, exact_result in zip(results, exact_results)
+                ]
+            )
+            self.report(f"{num_probes} probes", k, latencies, recall)
@@ -0,0 +1,43 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from music.importer import DEFAULT_BATCH_SIZE, ActivityImporter
+
+
+class Command(BaseCommand):
+
+    help = "Import streams and downloads from a distributor CSV report"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "report_csv",
+            help="CSV with date, streams and downloads columns, and isrc or artist and track columns",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Number of activity estimates to write at once",
+        )
+
+    def handle(self, *args, **options):
+        importer = ActivityImporter(batch_size=options["batch_size"])
+        try:
+            with open(options["report_csv"], newline="", encoding="utf-8-sig") as f:
+                stats = importer.import_csv(f)
+        except UnicodeDecodeError:
+            raise CommandError("The report must be a UTF-8 encoded CSV file.")
+        except csv.Error as e:
+            raise CommandError(
+                "The report is not a valid CSV file: {error}".format(error=e)
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Imported {rows} rows ({skipped_rows} skipped): "
+                "{created} activity estimates created, {updated} updated, "
+                "{rows_per_second:.0f} rows/s.".format(
+                    rows_per_second=importer.rows_per_second(), **stats
+                )
+            )
+        )
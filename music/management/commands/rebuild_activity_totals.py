@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from music.models import ActivityTotal, MonthlyActivityTotal
+
+
+class Command(BaseCommand):
+
+    help = "Rebuild all-time and monthly activity totals from activity estimates and verify them against live aggregates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify-only",
+            action="store_true",
+            help="Verify the stored activity totals without rebuilding them",
+        )
+
+    def handle(self, *args, **options):
+        mismatched_keys = []
+        for model in (ActivityTotal, MonthlyActivityTotal):
+            name = model._meta.verbose_name_plural
+            if not options["verify_only"]:
+                totals = model.objects.rebuild()
+                self.stdout.write(
+                    "Rebuilt {num_totals} {name}.".format(
+                        num_totals=len(totals), name=name
+                    )
+                )
+            mismatched_keys += [
+                "{name} {key}".format(name=name, key=key)
+                for key in model.objects.verify()
+            ]
+
+        if mismatched_keys:
+            raise CommandError(
+                "Activity totals do not match live aggregates: {keys}".format(
+                    keys=", ".join(mismatched_keys)
+                )
+            )
+        self.stdout.write(self.style.SUCCESS("Activity totals match live aggregates."))
@@ -0,0 +1,33 @@
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from music.recommender import recommender, save_recommender, train_recommender
+
+
+class Command(BaseCommand):
+
+    help = "Fit the song recommender on a CSV of songs and their audio features and save its artifacts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "songs_csv",
+            help="CSV of songs with their name, year, artists and audio features",
+        )
+        parser.add_argument(
+            "--output",
+            help="Directory to save the recommender artifacts to (defaults to settings.RECOMMENDER_ARTIFACTS_DIR)",
+        )
+
+    def handle(self, *args, **options):
+        artifacts = train_recommender(pd.read_csv(options["songs_csv"]))
+        output = options["output"] or settings.RECOMMENDER_ARTIFACTS_DIR
+        save_recommender(artifacts, output)
+        recommender.reset()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Trained the recommender on {num_songs} songs and saved it to {output}.".format(
+                    num_songs=len(artifacts["songs"]), output=output
+                )
+            )
+        )
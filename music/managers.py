@@ -0,0 +1,228 @@
+import collections
+import itertools
+import operator
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+
+
+def group_tracks_by_disc(tracks):
+    """
+    Group tracks ordered by disc and track number into a list of tracks per disc
+    """
+    return [
+        list(disc_tracks)
+        for _, disc_tracks in itertools.groupby(
+            tracks, key=operator.attrgetter("disc_number")
+        )
+    ]
+
+
+class AlbumManager(models.Manager):
+    def load(self, **filters):
+        """
+        Get an album with everything its detail page renders, in a fixed number of queries
+
+        The tracks are fetched in a single query and grouped by disc, and the
+        activity totals of every track in another, so the number of queries
+        does not grow with the number of discs or tracks.
+        """
+        from music.models import ActivityTotal, Track
+
+        album = (
+            self.select_related(
+                "project__artist__photo", "artwork", "albumbio", "audio"
+            )
+            .prefetch_related("marketplaceurl_set")
+            .get(**filters)
+        )
+        tracks = list(album.track_set.order_by("disc_number", "track_number"))
+        album._discs = group_tracks_by_disc(tracks)
+
+        # Tracks count the activity of their album as well as their own
+        album_content_type = ContentType.objects.get_for_model(album)
+        totals = ActivityTotal.objects.filter(
+            models.Q(content_type=album_content_type, object_id=album.id)
+            | models.Q(
+                content_type=ContentType.objects.get_for_model(Track),
+                object_id__in=[track.id for track in tracks],
+            )
+        ).values_list("activity_type", "content_type", "object_id", "total")
+        album_totals = collections.Counter()
+        track_totals = collections.defaultdict(collections.Counter)
+        for activity_type, content_type_id, object_id, total in totals:
+            if content_type_id == album_content_type.id:
+                album_totals[activity_type] += total
+            else:
+                track_totals[object_id][activity_type] += total
+        for track in tracks:
+            track._activity_totals = album_totals + track_totals[track.id]
+
+        return album
+
+
+class ActivityEstimateManager(models.Manager):
+
+    KEY_ATTNAMES = ("date", "activity_type", "content_type_id", "object_id")
+
+    def key(self, activity_estimate):
+        date = self.model._meta.get_field("date").to_python(activity_estimate.date)
+        return (date,) + tuple(
+            getattr(activity_estimate, attname) for attname in self.KEY_ATTNAMES[1:]
+        )
+
+    def bulk_upsert(self, activity_estimates):
+        """
+        Create or update activity estimates in bulk, by their date, activity type and object
+
+        Estimates with a total of 0 are only saved if they update an existing estimate.
+        The activity totals are updated with the changes. Returns the numbers of
+        estimates created and updated.
+        """
+        from music.models import ActivityTotal, MonthlyActivityTotal
+
+        activity_estimates = {
+            self.key(activity_estimate): activity_estimate
+            for activity_estimate in activity_estimates
+        }
+        if not activity_estimates:
+            return 0, 0
+
+        with transaction.atomic():
+            # Fetch the existing estimates of every object in the report at once
+            key_values = list(zip(*activity_estimates))
+            existing_estimates = {
+                self.key(activity_estimate): activity_estimate
+                for activity_estimate in self.select_for_update().filter(
+                    **{
+                        f"{attname}__in": set(values)
+                        for attname, values in zip(self.KEY_ATTNAMES, key_values)
+                    }
+                )
+            }
+
+            new_estimates, updated_estimates = [], []
+            deltas = collections.Counter()
+            for key, activity_estimate in activity_estimates.items():
+                activity_estimate.date = key[0]
+                existing_estimate = existing_estimates.get(key)
+                if existing_estimate is None:
+                    if activity_estimate.total:
+                        new_estimates.append(activity_estimate)
+                        deltas[key] += activity_estimate.total
+                    continue
+
+                deltas[key] += activity_estimate.total - existing_estimate.total
+                existing_estimate.total = activity_estimate.total
+                updated_estimates.append(existing_estimate)
+
+            self.bulk_create(new_estimates)
+            self.bulk_update(updated_estimates, ["total"])
+            for model in (ActivityTotal, MonthlyActivityTotal):
+                model.objects.add(deltas)
+
+        return len(new_estimates), len(updated_estimates)
+
+
+class ActivityTotalManager(models.Manager):
+    """
+    Manage the totals of activity estimates, grouped by the model's KEY_FIELDS
+    """
+
+    OBJECT_ATTNAMES = ("activity_type", "content_type_id", "object_id")
+
+    def calculate(self, estimates=None):
+        """
+        Aggregate live totals from activity estimates, keyed by the values of KEY_FIELDS
+        """
+        from music.models import ActivityEstimate
+
+        if estimates is None:
+            estimates = ActivityEstimate.objects.all()
+        totals = (
+            estimates.annotate(**self.model.KEY_ANNOTATIONS)
+            .values(*self.model.KEY_FIELDS)
+            .annotate(total=models.Sum("total"))
+            .order_by()
+        )
+        return {
+            tuple(totals[field] for field in self.model.KEY_FIELDS): totals["total"]
+            for totals in totals
+        }
+
+    def add(self, deltas):
+        """
+        Add changes to the totals of activity estimates, keyed by date, activity type and object
+        """
+        totals_deltas = collections.Counter()
+        for (date, *object_key), delta in deltas.items():
+            if delta:
+                totals_deltas[self.model.total_key(*object_key, date=date)] += delta
+        if not totals_deltas:
+            return
+
+        key_attnames = [
+            self.model._meta.get_field(field).attname for field in self.model.KEY_FIELDS
+        ]
+        with transaction.atomic():
+            existing_totals = self.select_for_update().filter(
+                **{
+                    f"{attname}__in": set(values)
+                    for attname, values in zip(key_attnames, zip(*totals_deltas))
+                }
+            )
+            updated_totals = []
+            for existing_total in existing_totals:
+                key = tuple(
+                    getattr(existing_total, attname) for attname in key_attnames
+                )
+                if key in totals_deltas:
+                    existing_total.total += totals_deltas.pop(key)
+                    updated_totals.append(existing_total)
+            self.bulk_update(updated_totals, ["total"])
+            self._create_totals(totals_deltas)
+
+    def _create_totals(self, totals):
+        key_attnames = [
+            self.model._meta.get_field(field).attname for field in self.model.KEY_FIELDS
+        ]
+        return self.bulk_create(
+            self.model(total=total, **dict(zip(key_attnames, key)))
+            for key, total in totals.items()
+        )
+
+    def refresh(self, activity_estimate):
+        """
+        Recalculate the stored totals of the object of an activity estimate
+        """
+        from music.models import ActivityEstimate
+
+        object_filter = {
+            attname: getattr(activity_estimate, attname)
+            for attname in self.OBJECT_ATTNAMES
+        }
+        with transaction.atomic():
+            self.filter(**object_filter).delete()
+            return self._create_totals(
+                self.calculate(ActivityEstimate.objects.filter(**object_filter))
+            )
+
+    def rebuild(self):
+        with transaction.atomic():
+            self.all().delete()
+            return self._create_totals(self.calculate())
+
+    def verify(self):
+        """
+        Return the keys of stored totals that disagree with live aggregates
+        """
+        live_totals = self.calculate()
+        stored_totals = {
+            row[:-1]: row[-1]
+            for row in self.values_list(*self.model.KEY_FIELDS, "total")
+        }
+        return sorted(
+            key
+            for key in set(live_totals) | set(stored_totals)
+            if live_totals.get(key, 0) != stored_totals.get(key, 0)
+        )
@@ -0,0 +1,104 @@
+# Generated by Django 2.2.14 on 2026-10-18 03:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("music", "0007_auto_20190908_2201"),
+    ]
+
+    def create_activity_totals(apps, schema_editor):
+        ActivityEstimate = apps.get_model("music", "ActivityEstimate")
+        for model_name, key_annotations in (
+            ("ActivityTotal", {}),
+            ("MonthlyActivityTotal", {"month": TruncMonth("date")}),
+        ):
+            Model = apps.get_model("music", model_name)
+            totals = (
+                ActivityEstimate.objects.annotate(**key_annotations)
+                .values("activity_type", "content_type", "object_id", *key_annotations)
+                .annotate(total=models.Sum("total"))
+                .order_by()
+            )
+            Model.objects.bulk_create(
+                Model(content_type_id=total.pop("content_type"), **total)
+                for total in totals
+            )
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyActivityTotal",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "activity_type",
+                    models.CharField(
+                        choices=[("stream", "Stream"), ("download", "Download")],
+                        max_length=8,
+                    ),
+                ),
+                ("object_id", models.PositiveIntegerField()),
+                ("month", models.DateField(help_text="The first day of the month")),
+                ("total", models.PositiveIntegerField(default=0)),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.ContentType",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {
+                    ("content_type", "object_id", "activity_type", "month")
+                },
+            },
+        ),
+        migrations.CreateModel(
+            name="ActivityTotal",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "activity_type",
+                    models.CharField(
+                        choices=[("stream", "Stream"), ("download", "Download")],
+                        max_length=8,
+                    ),
+                ),
+                ("object_id", models.PositiveIntegerField()),
+                ("total", models.PositiveIntegerField(default=0)),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.ContentType",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("content_type", "object_id", "activity_type")},
+            },
+        ),
+        migrations.RunPython(create_activity_totals, migrations.RunPython.noop),
+    ]
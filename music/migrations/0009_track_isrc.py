@@ -0,0 +1,22 @@
+# Generated by Django 2.2.14 on 2026-10-18 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("music", "0008_activitytotal_monthlyactivitytotal")]
+
+    operations = [
+        migrations.AddField(
+            model_name="track",
+            name="isrc",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                help_text="The International Standard Recording Code of the track, used to match distributor reports",
+                max_length=12,
+                verbose_name="ISRC",
+            ),
+        )
+    ]
@@ -5,34 +5,12 @@
 """
 
 import boto3
-import os
-import numpy as np
-import pandas as pd
-import seaborn as sns
-import plotly.express as px 
-import matplotlib.pyplot as plt
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-from sklearn.metrics import euclidean_distances
-from scipy.spatial.distance import cdist
-import difflib
-from collections import defaultdict
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline
-from sklearn.manifold import TSNE
-from sklearn.decomposition import PCA
-from sklearn.metrics import euclidean_distances
-from scipy.spatial.distance import cdist
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline
-from sklearn.manifold import TSNE
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import TruncMonth
 from django.urls import reverse
 from django.utils import timezone
 from gfklookupwidget.fields import GfkLookupField
@@ -40,6 +18,12 @@ from markdown_deux.templatetags.markdown_deux_tags import markdown_allowed
 from pigeon.url.utils import add_params_to_url
 
 from campaign.models import Project
+from music.managers import (
+    ActivityEstimateManager,
+    ActivityTotalManager,
+    AlbumManager,
+    group_tracks_by_disc,
+)
 
 
 class Album(models.Model):
@@ -53,6 +37,8 @@ class Album(models.Model):
     )
     release_date = models.DateField(null=True, blank=True)
 
+    objects = AlbumManager()
+
     def __str__(self):
         return self.name
 
@@ -76,38 +62,35 @@ class Album(models.Model):
         )
 
     def discs(self):
-        disc_numbers = (
-            self.track_set.all()
-            .values_list("disc_number", flat=True)
-            .distinct()
-            .order_by("disc_number")
-        )
-        return (
-            self.track_set.filter(disc_number=disc).order_by("track_number")
-            for disc in disc_numbers
+        # Albums from Album.objects.load() already have their tracks grouped by disc
+        if hasattr(self, "_discs"):
+            return self._discs
+        return group_tracks_by_disc(
+            self.track_set.order_by("disc_number", "track_number")
         )
 
     def total_activity(self, activity_type):
-        tracks = self.track_set.all()
-        if not tracks:
+        track_ids = list(self.track_set.values_list("id", flat=True))
+        if not track_ids:
             return 0
 
-        all_activities = ActivityEstimate.objects.filter(activity_type=activity_type)
-        album_events = (
-            all_activities.filter(
-                content_type=ContentType.objects.get_for_model(self), object_id=self.id
-            ).aggregate(total=models.Sum("total"))["total"]
-            or 0
-        )
-        track_events = (
-            all_activities.filter(
-                content_type=ContentType.objects.get_for_model(tracks[0]),
-                object_id__in=tracks.values_list("id", flat=True),
-            ).aggregate(total=models.Sum("total"))["total"]
-            or 0
-        )
-
-        return album_events * tracks.count() + track_events
+        album_content_type = ContentType.objects.get_for_model(self)
+        totals = ActivityTotal.objects.filter(
+            models.Q(content_type=album_content_type, object_id=self.id)
+            | models.Q(
+                content_type=ContentType.objects.get_for_model(Track),
+                object_id__in=track_ids,
+            ),
+            activity_type=activity_type,
+        ).values_list("content_type", "total")
+        album_events = track_events = 0
+        for content_type_id, total in totals:
+            if content_type_id == album_content_type.id:
+                album_events += total
+            else:
+                track_events += total
+
+        return album_events * len(track_ids) + track_events
 
     def total_downloads(self):
         return self.total_activity(ActivityEstimate.ACTIVITY_DOWNLOAD)
@@ -123,6 +106,13 @@ class Track(models.Model):
     track_number = models.PositiveSmallIntegerField()
     name = models.CharField(max_length=60)
     duration = models.DurationField(null=True, blank=True)
+    isrc = models.CharField(
+        max_length=12,
+        blank=True,
+        db_index=True,
+        verbose_name="ISRC",
+        help_text="The International Standard Recording Code of the track, used to match distributor reports",
+    )
 
     class Meta:
         unique_together = (("album", "disc_number", "track_number"),)
@@ -133,8 +123,11 @@ class Track(models.Model):
         )
 
     def total_activity(self, activity_type):
+        # Tracks from Album.objects.load() already have their activity totals
+        if hasattr(self, "_activity_totals"):
+            return self._activity_totals[activity_type]
         return (
-            ActivityEstimate.objects.filter(
+            ActivityTotal.objects.filter(
                 models.Q(
                     content_type=ContentType.objects.get_for_model(self.album),
                     object_id=self.album.id,
@@ -286,125 +279,71 @@ class ActivityEstimate(models.Model):
     content_object = GenericForeignKey()
     total = models.PositiveIntegerField()
 
+    objects = ActivityEstimateManager()
+
     class Meta:
         unique_together = (("date", "activity_type", "content_type", "object_id"),)
 
     def __str__(self):
         return str(self.content_object)
 
-class RecommenderSystem(models.Model):
-
-    data = pd.read_csv("C://Users//soham//Downloads//data.csv")
-    genre_data = pd.read_csv('C://Users//soham//Downloads//data_by_genres.csv')
-    year_data = pd.read_csv('C://Users//soham//Downloads//data_by_year.csv')
-    cluster_pipeline = Pipeline([('scaler', StandardScaler()), ('kmeans', KMeans(n_clusters=10))])
-    X = genre_data.select_dtypes(np.number)
-    cluster_pipeline.fit(X)
-    genre_data['cluster'] = cluster_pipeline.predict(X)
-    tsne_pipeline = Pipeline([('scaler', StandardScaler()), ('tsne', TSNE(n_components=2, verbose=1))])
-    genre_embedding = tsne_pipeline.fit_transform(X)
-    projection = pd.DataFrame(columns=['x', 'y'], data=genre_embedding)
-    projection['genres'] = genre_data['genres']
-    projection['cluster'] = genre_data['cluster']
-    song_cluster_pipeline = Pipeline([('scaler', StandardScaler()), ('kmeans', KMeans(n_clusters=20, verbose=False))], verbose=False)
-    X = data.select_dtypes(np.number)
-    number_cols = list(X.columns)
-    song_cluster_pipeline.fit(X)
-    song_cluster_labels = song_cluster_pipeline.predict(X)
-    data['cluster_label'] = song_cluster_labels
-    pca_pipeline = Pipeline([('scaler', StandardScaler()), ('PCA', PCA(n_components=2))])
-    song_embedding = pca_pipeline.fit_transform(X)
-    projection = pd.DataFrame(columns=['x', 'y'], data=song_embedding)
-    projection['title'] = data['name']
-    projection['cluster'] = data['cluster_label']
-    sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id="fa3017cd775f4a87b73c890bf6fa1ede", client_secret="6b316306bfd5498c8ed76866eb49e9d3"))
-    def find_song(name, year):
-        song_data = defaultdict()
-        results = sp.search(q= 'track: {} year: {}'.format(name,year), limit=1)
-        if results['tracks']['items'] == []:
-            return None
-
-        results = results['tracks']['items'][0]
-        track_id = results['id']
-        audio_features = sp.audio_features(track_id)[0]
-
-        song_data['name'] = [name]
-        song_data['year'] = [year]
-        song_data['explicit'] = [int(results['explicit'])]
-        song_data['duration_ms'] = [results['duration_ms']]
-        song_data['popularity'] = [results['popularity']] 
-        
-        for key, value in audio_features.items():
-            song_data[key] = value
-
-        return pd.DataFrame(song_data)
-    number_cols = ['valence', 'year', 'acousticness', 'danceability', 'duration_ms', 'energy', 'explicit',
-    'instrumentalness', 'key', 'liveness', 'loudness', 'mode', 'popularity', 'speechiness', 'tempo']
-
-
-    def get_song_data(song, spotify_data):
-    
-        try:
-            song_data = spotify_data[(spotify_data['name'] == song['name']) 
-                                & (spotify_data['year'] == song['year'])].iloc[0]
-            return song_data
-    
-        except IndexError:
-            return find_song(song['name'], song['year'])
-        
-
-    def get_mean_vector(song_list, spotify_data):
-        
-        song_vectors = []
-        
-        for song in song_list:
-            song_data = get_song_data(song, spotify_data)
-            if song_data is None:
-                print('Warning: {} does not exist in Spotify or in database'.format(song['name']))
-                continue
-            song_vector = song_data[number_cols].values
-            song_vectors.append(song_vector)  
-        
-        song_matrix = np.array(list(song_vectors))
-        return np.mean(song_matrix, axis=0)
-
-
-    def flatten_dict_list(dict_list):
-        
-        flattened_dict = defaultdict()
-        for key in dict_list[0].keys():
-            flattened_dict[key] = []
-        
-        for dictionary in dict_list:
-            for key, value in dictionary.items():
-                flattened_dict[key].append(value)
-                
-        return flattened_dict
-
-
-    def recommend_songs( song_list, spotify_data, n_songs=10):
-        
-        metadata_cols = ['name', 'year', 'artists']
-        song_dict = flatten_dict_list(song_list)
-        
-        song_center = get_mean_vector(song_list, spotify_data)
-        scaler = song_cluster_pipeline.steps[0][1]
-        scaled_data = scaler.transform(spotify_data[number_cols])
-        scaled_song_center = scaler.transform(song_center.reshape(1, -1))
-        distances = cdist(scaled_song_center, scaled_data, 'cosine')
-        index = list(np.argsort(distances)[:, :n_songs][0])
-        
-        rec_songs = spotify_data.iloc[index]
-        rec_songs = rec_songs[~rec_songs['name'].isin(song_dict['name'])]
-        return rec_songs[metadata_cols].to_dict(orient='records')
-
-    recommend_songs([{'name': 'Come As You Are', 'year':1991},
-                {'name': 'Smells Like Teen Spirit', 'year': 1991},
-                {'name': 'Lithium', 'year': 1992},
-                {'name': 'All Apologies', 'year': 1993},
-                {'name': 'Stay Away', 'year': 1993}],  data)
-        
 
+class ActivityTotal(models.Model):
+    """
+    The all-time total of the activity estimates of an album or track
+    """
+
+    KEY_FIELDS = ("activity_type", "content_type", "object_id")
+    KEY_ANNOTATIONS = {}
+
+    activity_type = models.CharField(
+        choices=ActivityEstimate.ACTIVITY_CHOICES, max_length=8
+    )
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey()
+    total = models.PositiveIntegerField(default=0)
+
+    objects = ActivityTotalManager()
+
+    class Meta:
+        unique_together = (("content_type", "object_id", "activity_type"),)
+
+    @staticmethod
+    def total_key(activity_type, content_type_id, object_id, date):
+        return activity_type, content_type_id, object_id
+
+    def __str__(self):
+        return str(self.content_object)
+
+
+class MonthlyActivityTotal(models.Model):
+    """
+    The total of the activity estimates of an album or track in a month
+    """
 
+    KEY_FIELDS = ("activity_type", "content_type", "object_id", "month")
+    KEY_ANNOTATIONS = {"month": TruncMonth("date")}
 
+    activity_type = models.CharField(
+        choices=ActivityEstimate.ACTIVITY_CHOICES, max_length=8
+    )
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey()
+    month = models.DateField(help_text="The first day of the month")
+    total = models.PositiveIntegerField(default=0)
+
+    objects = ActivityTotalManager()
+
+    class Meta:
+        unique_together = (("content_type", "object_id", "activity_type", "month"),)
+
+    @staticmethod
+    def total_key(activity_type, content_type_id, object_id, date):
+        return activity_type, content_type_id, object_id, date.replace(day=1)
 
+    def __str__(self):
+        return "{content_object} ({month:%B %Y})".format(
+            content_object=self.content_object, month=self.month
+        )
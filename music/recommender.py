@@ -0,0 +1,297 @@
+import functools
+import os
+import threading
+
+import joblib
+import numpy as np
+import spotipy
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler
+from spotipy.oauth2 import SpotifyClientCredentials
+
+NUMBER_COLUMNS = [
+    "valence",
+    "year",
+    "acousticness",
+    "danceability",
+    "duration_ms",
+    "energy",
+    "explicit",
+    "instrumentalness",
+    "key",
+    "liveness",
+    "loudness",
+    "mode",
+    "popularity",
+    "speechiness",
+    "tempo",
+]
+METADATA_COLUMNS = ["name", "year", "artists"]
+SONG_COLUMNS = METADATA_COLUMNS + [
+    column for column in NUMBER_COLUMNS if column not in METADATA_COLUMNS
+]
+NUM_SONG_CLUSTERS = 20
+NUM_KMEANS_INITS = 10
+RANDOM_STATE = 0
+MODELS_FILENAME = "recommender.joblib"
+FEATURES_FILENAME = "features.npy"
+FEATURE_NORMS_FILENAME = "feature_norms.npy"
+
+
+def train_recommender(songs):
+    """
+    Fit the scaler, song clusters and 2D projection on a DataFrame of songs and their audio features
+    """
+    songs = songs[SONG_COLUMNS].reset_index(drop=True)
+    scaler = StandardScaler()
+    features = scaler.fit_transform(songs[NUMBER_COLUMNS].to_numpy(dtype=float))
+    # Seeded so that retraining on the same songs saves the same artifacts
+    kmeans = KMeans(
+        n_clusters=min(NUM_SONG_CLUSTERS, len(songs)),
+        n_init=NUM_KMEANS_INITS,
+        random_state=RANDOM_STATE,
+    ).fit(features)
+    pca = PCA(n_components=2, random_state=RANDOM_STATE).fit(features)
+    songs["cluster"] = kmeans.labels_
+    return {
+        "scaler": scaler,
+        "kmeans": kmeans,
+        "pca": pca,
+        "songs": songs[METADATA_COLUMNS + ["cluster"]],
+        "features": features.astype(np.float32),
+    }
+
+
+def save_recommender(artifacts, directory):
+    """
+    Save the scaled song features as a .npy file (to be memory-mapped) and everything else with joblib
+    """
+    os.makedirs(directory, exist_ok=True)
+    features = artifacts["features"]
+    np.save(os.path.join(directory, FEATURES_FILENAME), features)
+    np.save(
+        os.path.join(directory, FEATURE_NORMS_FILENAME),
+        np.linalg.norm(features, axis=1),
+    )
+    joblib.dump(
+        {key: value for key, value in artifacts.items() if key != "features"},
+        os.path.join(directory, MODELS_FILENAME),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_spotify_client(client_id, client_secret):
+    return spotipy.Spotify(
+        auth_manager=SpotifyClientCredentials(
+            client_id=client_id, client_secret=client_secret
+        )
+    )
+
+
+def normalize_song_name(name):
+    return " ".join(str(name).casefold().split())
+
+
+def song_key(name, year):
+    return normalize_song_name(name), int(year)
+
+
+def cosine_similarities(vectors, vector_norms, vector):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarities = (vectors @ vector) / (vector_norms * np.linalg.norm(vector))
+    return np.nan_to_num(similarities, nan=-np.inf)
+
+
+def top_k(similarities, k):
+    """
+    Get the indices of the k largest similarities in order, only sorting those k
+    """
+    k = min(k, len(similarities))
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+    index = np.argpartition(-similarities, k - 1)[:k]
+    return index[np.argsort(-similarities[index], kind="stable")]
+
+
+class ExactIndex:
+    """
+    Search every song for the most similar ones
+    """
+
+    def __init__(self, artifacts):
+        self.features = artifacts["features"]
+        self.feature_norms = artifacts["feature_norms"]
+
+    def search(self, vector, k):
+        return top_k(cosine_similarities(self.features, self.feature_norms, vector), k)
+
+
+class ClusterPrunedIndex:
+    """
+    Search only the songs in the num_probes song clusters closest to the query
+
+    Probing more clusters trades latency for recall. Queries that would not
+    find k songs in the probed clusters fall back to exact search.
+    """
+
+    def __init__(self, artifacts, num_probes=None):
+        self.features = artifacts["features"]
+        self.feature_norms = artifacts["feature_norms"]
+        self.num_probes = num_probes or settings.RECOMMENDER_NUM_PROBES
+        self.exact_index = ExactIndex(artifacts)
+
+        self.centroids = artifacts["kmeans"].cluster_centers_.astype(np.float32)
+        self.centroid_norms = np.linalg.norm(self.centroids, axis=1)
+
+        # The rows of each cluster, as slices of the rows sorted by cluster
+        clusters = artifacts["songs"]["cluster"].to_numpy()
+        self.cluster_rows = np.argsort(clusters, kind="stable")
+        self.cluster_offsets = np.append(
+            0, np.cumsum(np.bincount(clusters, minlength=len(self.centroids)))
+        )
+
+    def rows_in_cluster(self, cluster):
+        start, end = self.cluster_offsets[cluster], self.cluster_offsets[cluster + 1]
+        return self.cluster_rows[start:end]
+
+    def search(self, vector, k):
+        centroid_similarities = cosine_similarities(
+            self.centroids, self.centroid_norms, vector
+        )
+        clusters = top_k(centroid_similarities, self.num_probes)
+        candidates = np.sort(np.concatenate(list(map(self.rows_in_cluster, clusters))))
+        if len(candidates) < k:
+            return self.exact_index.search(vector, k)
+
+        similarities = cosine_similarities(
+            self.features[candidates], self.feature_norms[candidates], vector
+        )
+        return candidates[top_k(similarities, k)]
+
+
+class Recommender:
+    """
+    Recommend songs similar to a list of songs
+
+    The fitted artifacts (see the train_recommender command) are loaded from
+    settings.RECOMMENDER_ARTIFACTS_DIR on first use rather than at import time.
+    The song feature matrix is memory-mapped read-only, so every worker
+    process shares the same pages of it instead of holding its own copy.
+    """
+
+    def __init__(self, artifacts_dir=None):
+        self.artifacts_dir = artifacts_dir
+        self._artifacts = None
+        self._lock = threading.Lock()
+
+    @property
+    def artifacts(self):
+        if self._artifacts is None:
+            with self._lock:
+                if self._artifacts is None:
+                    self._artifacts = self.load()
+        return self._artifacts
+
+    def reset(self):
+        with self._lock:
+            self._artifacts = None
+
+    def load(self):
+        directory = self.artifacts_dir or settings.RECOMMENDER_ARTIFACTS_DIR
+        try:
+            artifacts = joblib.load(os.path.join(directory, MODELS_FILENAME))
+            artifacts["features"] = np.load(
+                os.path.join(directory, FEATURES_FILENAME), mmap_mode="r"
+            )
+            artifacts["feature_norms"] = np.load(
+                os.path.join(directory, FEATURE_NORMS_FILENAME)
+            )
+        except FileNotFoundError:
+            raise ImproperlyConfigured(
+                f"Recommender artifacts not found in {directory}, run the train_recommender command"
+            )
+        artifacts["index"] = import_string(settings.RECOMMENDER_INDEX)(artifacts)
+
+        # Index the rows by song, the first of duplicate songs being the one found
+        songs = artifacts["songs"]
+        artifacts["song_rows"] = {}
+        for row, key in enumerate(map(song_key, songs["name"], songs["year"])):
+            artifacts["song_rows"].setdefault(key, row)
+        return artifacts
+
+    def find_song(self, name, year):
+        """
+        Look up the audio features of a song on Spotify
+        """
+        if not settings.SPOTIFY_CLIENT_ID or not settings.SPOTIFY_CLIENT_SECRET:
+            return None
+        spotify = get_spotify_client(
+            settings.SPOTIFY_CLIENT_ID, settings.SPOTIFY_CLIENT_SECRET
+        )
+        results = spotify.search(q=f"track: {name} year: {year}", limit=1)
+        if not results["tracks"]["items"]:
+            return None
+
+        track = results["tracks"]["items"][0]
+        song = dict(spotify.audio_features(track["id"])[0])
+        song.update(
+            {
+                "name": name,
+                "year": year,
+                "explicit": int(track["explicit"]),
+                "duration_ms": track["duration_ms"],
+                "popularity": track["popularity"],
+            }
+        )
+        song_vector = np.array([[song[column] for column in NUMBER_COLUMNS]])
+        return self.artifacts["scaler"].transform(song_vector)[0]
+
+    def resolve_songs(self, song_list):
+        """
+        Get the dataset row of each song (dicts with name and year), or None if it is not in the dataset
+        """
+        song_rows = self.artifacts["song_rows"]
+        return [
+            song_rows.get(song_key(song["name"], song["year"])) for song in song_list
+        ]
+
+    def get_song_vectors(self, song_list):
+        """
+        Get the scaled audio features of the songs, from the dataset or else from Spotify
+        """
+        rows = self.resolve_songs(song_list)
+        found_rows = [row for row in rows if row is not None]
+        song_vectors = list(self.artifacts["features"][found_rows])
+        for song, row in zip(song_list, rows):
+            if row is None:
+                song_vector = self.find_song(song["name"], song["year"])
+                if song_vector is not None:
+                    song_vectors.append(song_vector)
+        return song_vectors
+
+    def recommend_songs(self, song_list, num_songs=10):
+        """
+        Recommend the songs closest to the average of the given songs (dicts with name and year)
+        """
+        song_vectors = self.get_song_vectors(song_list)
+        if not song_vectors:
+            return []
+
+        # Scaling is affine, so the average of the scaled features
+        # is the scaled average of the features
+        song_center = np.mean(song_vectors, axis=0, dtype=np.float32)
+        index = self.artifacts["index"].search(song_center, num_songs)
+
+        recommended_songs = self.artifacts["songs"].iloc[index]
+        song_names = {normalize_song_name(song["name"]) for song in song_list}
+        recommended_songs = recommended_songs[
+            ~recommended_songs["name"].map(normalize_song_name).isin(song_names)
+        ]
+        return recommended_songs[METADATA_COLUMNS].to_dict(orient="records")
+
+
+recommender = Recommender()
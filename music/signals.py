@@ -0,0 +1,45 @@
+from django.db import models
+from django.dispatch import receiver
+
+from music.models import ActivityEstimate, ActivityTotal, MonthlyActivityTotal
+
+
+def refresh_activity_totals(activity_estimate):
+    for model in (ActivityTotal, MonthlyActivityTotal):
+        model.objects.refresh(activity_estimate)
+
+
+@receiver(
+    models.signals.pre_save,
+    sender=ActivityEstimate,
+    dispatch_uid="remember_previous_activity_estimate_handler",
+)
+def remember_previous_activity_estimate_handler(sender, instance, **kwargs):
+    # An edited estimate may have moved to another object,
+    # whose totals then need to be refreshed as well
+    instance._previous_activity_estimate = None
+    if instance.pk:
+        instance._previous_activity_estimate = ActivityEstimate.objects.filter(
+            pk=instance.pk
+        ).first()
+
+
+@receiver(
+    models.signals.post_save,
+    sender=ActivityEstimate,
+    dispatch_uid="refresh_activity_totals_from_saved_estimate_handler",
+)
+def refresh_activity_totals_from_saved_estimate_handler(sender, instance, **kwargs):
+    previous_activity_estimate = getattr(instance, "_previous_activity_estimate", None)
+    if previous_activity_estimate:
+        refresh_activity_totals(previous_activity_estimate)
+    refresh_activity_totals(instance)
+
+
+@receiver(
+    models.signals.post_delete,
+    sender=ActivityEstimate,
+    dispatch_uid="refresh_activity_totals_from_deleted_estimate_handler",
+)
+def refresh_activity_totals_from_deleted_estimate_handler(sender, instance, **kwargs):
+    refresh_activity_totals(instance)
@@ -4,14 +4,89 @@
 
 """
 
+import csv
+import datetime
+import io
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
 from django.contrib.contenttypes.models import ContentType
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from scipy.spatial.distance import cdist
 
+from campaign.factories import CampaignFactory
 from campaign.models import Campaign
+from music.admin.views import DailyReportAdminView
 from music.factories import ActivityEstimateFactory, AlbumFactory, TrackFactory
-from music.models import ActivityEstimate, Album
-from perdiem.tests import PerDiemTestCase
+from music.models import (
+    ActivityEstimate,
+    ActivityTotal,
+    Album,
+    MonthlyActivityTotal,
+    Track,
+)
+from music.recommender import (
+    NUMBER_COLUMNS,
+    ClusterPrunedIndex,
+    ExactIndex,
+    Recommender,
+    train_recommender,
+)
+from perdiem.tests import MigrationTestCase, PerDiemTestCase
+
+
+class CreateActivityTotalsMigrationTestCase(MigrationTestCase):
+
+    migrate_from = "0007_auto_20190908_2201"
+    migrate_to = "0008_activitytotal_monthlyactivitytotal"
+
+    def setUpBeforeMigration(self, apps):
+        ActivityEstimateForMigrationTestCase = apps.get_model(
+            "music", "ActivityEstimate"
+        )
+
+        # Create streams of a track on two days in January and one in February
+        self.content_type_id = ContentType.objects.get_for_model(Track).id
+        for date, total in (
+            (datetime.date(2020, 1, 1), 1),
+            (datetime.date(2020, 1, 31), 2),
+            (datetime.date(2020, 2, 1), 4),
+        ):
+            ActivityEstimateForMigrationTestCase.objects.create(
+                date=date,
+                activity_type=ActivityEstimate.ACTIVITY_STREAM,
+                content_type_id=self.content_type_id,
+                object_id=1,
+                total=total,
+            )
+
+    def testActivityTotalsCreatedFromEstimates(self):
+        ActivityTotal = self.apps.get_model("music", "ActivityTotal")
+        MonthlyActivityTotal = self.apps.get_model("music", "MonthlyActivityTotal")
+        self.assertEqual(
+            ActivityTotal.objects.get(
+                content_type_id=self.content_type_id, object_id=1
+            ).total,
+            7,
+        )
+        self.assertEqual(
+            list(
+                MonthlyActivityTotal.objects.filter(
+                    content_type_id=self.content_type_id, object_id=1
+                )
+                .order_by("month")
+                .values_list("month", "total")
+            ),
+            [(datetime.date(2020, 1, 1), 3), (datetime.date(2020, 2, 1), 4)],
+        )
 
 
 class MusicModelsTestCase(TestCase):
@@ -60,14 +135,371 @@ class MusicModelsTestCase(TestCase):
         self.assertEqual(track.total_downloads(), 1)
         self.assertEqual(track.total_streams(), 1)
 
+    def testActivityTotalsFollowActivityEstimates(self):
+        # Create a track streamed twice in January
+        activity_estimate = ActivityEstimateFactory(
+            date=datetime.date(2020, 1, 1), total=1
+        )
+        track = activity_estimate.content_object
+        ActivityEstimateFactory(
+            date=datetime.date(2020, 1, 2), content_object=track, total=2
+        )
+        self.assertEqual(track.total_streams(), 3)
+        self.assertEqual(
+            list(MonthlyActivityTotal.objects.values_list("month", "total")),
+            [(datetime.date(2020, 1, 1), 3)],
+        )
+
+        # Move one of the estimates to another track in February
+        other_track = TrackFactory()
+        activity_estimate.content_object = other_track
+        activity_estimate.date = datetime.date(2020, 2, 1)
+        activity_estimate.save()
+        self.assertEqual(track.total_streams(), 2)
+        self.assertEqual(other_track.total_streams(), 1)
+        self.assertEqual(
+            MonthlyActivityTotal.objects.get(object_id=other_track.id).month,
+            datetime.date(2020, 2, 1),
+        )
+
+        # Delete the estimate
+        activity_estimate.delete()
+        self.assertEqual(other_track.total_streams(), 0)
+        self.assertFalse(ActivityTotal.objects.filter(object_id=other_track.id))
+
+    def testRebuildActivityTotals(self):
+        activity_estimate = ActivityEstimateFactory(total=5)
+
+        # Verify that the activity totals match the estimates
+        call_command("rebuild_activity_totals", verify_only=True, stdout=io.StringIO())
+
+        # Verify that a corrupted activity total is detected and then rebuilt
+        ActivityTotal.objects.update(total=1)
+        with self.assertRaises(CommandError):
+            call_command(
+                "rebuild_activity_totals", verify_only=True, stdout=io.StringIO()
+            )
+        call_command("rebuild_activity_totals", stdout=io.StringIO())
+        self.assertEqual(activity_estimate.content_object.total_streams(), 5)
+
     def testUnicodeOfActivityEstimateIsContentObject(self):
         activity_estimate = ActivityEstimateFactory()
         self.assertEqual(str(activity_estimate), str(activity_estimate.content_object))
 
 
+class RecommenderTestCase(TestCase):
+    def setUp(self):
+        # Create a CSV of songs with random audio features
+        random = np.random.RandomState(0)
+        songs = pd.DataFrame(
+            random.rand(200, len(NUMBER_COLUMNS)), columns=NUMBER_COLUMNS
+        )
+        songs["name"] = [f"Song {i}" for i in range(len(songs))]
+        songs["year"] = 2000 + np.arange(len(songs)) % 5
+        songs["artists"] = "Artist"
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.songs_csv = os.path.join(directory.name, "songs.csv")
+        songs.to_csv(self.songs_csv, index=False)
+        self.artifacts_dir = os.path.join(directory.name, "recommender")
+
+    def train(self):
+        call_command(
+            "train_recommender",
+            self.songs_csv,
+            output=self.artifacts_dir,
+            stdout=io.StringIO(),
+        )
+
+    def testTrainAndRecommendSongs(self):
+        # The recommender does not load anything until it is used
+        recommender = Recommender(artifacts_dir=self.artifacts_dir)
+        self.train()
+
+        # Verify that the closest song to a song is recommended
+        # and that the song itself is not
+        recommendations = recommender.recommend_songs(
+            [{"name": "Song 0", "year": 2000}], num_songs=2
+        )
+        self.assertEqual(len(recommendations), 1)
+        self.assertNotEqual(recommendations[0]["name"], "Song 0")
+
+    def testTrainingIsDeterministic(self):
+        songs = pd.read_csv(self.songs_csv)
+        artifacts = train_recommender(songs)
+        retrained_artifacts = train_recommender(songs)
+
+        # Verify that retraining on the same songs gives the same clusters and projection
+        self.assertEqual(
+            artifacts["songs"]["cluster"].tolist(),
+            retrained_artifacts["songs"]["cluster"].tolist(),
+        )
+        np.testing.assert_array_equal(
+            artifacts["kmeans"].cluster_centers_,
+            retrained_artifacts["kmeans"].cluster_centers_,
+        )
+        np.testing.assert_array_equal(
+            artifacts["pca"].components_, retrained_artifacts["pca"].components_
+        )
+
+    def testResolveSongs(self):
+        self.train()
+        recommender = Recommender(artifacts_dir=self.artifacts_dir)
+
+        # Verify that songs are found regardless of case and whitespace
+        # and that songs not in the dataset are not
+        self.assertEqual(
+            recommender.resolve_songs(
+                [
+                    {"name": "Song 7", "year": 2002},
+                    {"name": " song  3", "year": "2003"},
+                    {"name": "Song 3", "year": 2004},
+                ]
+            ),
+            [7, 3, None],
+        )
+
+    @override_settings(RECOMMENDER_INDEX="music.recommender.ExactIndex")
+    def testExactSearchMatchesSortingAllSongs(self):
+        self.train()
+        recommender = Recommender(artifacts_dir=self.artifacts_dir)
+
+        # Verify that the song features are memory-mapped and that the top songs
+        # are the same as when sorting the cosine distances to every song
+        features = recommender.artifacts["features"]
+        self.assertIsInstance(features, np.memmap)
+        distances = cdist(features[:1], features, "cosine")[0]
+        recommendations = recommender.recommend_songs(
+            [{"name": "Song 0", "year": 2000}], num_songs=10
+        )
+        self.assertEqual(
+            [song["name"] for song in recommendations],
+            [f"Song {i}" for i in np.argsort(distances)[1:10]],
+        )
+
+    def testClusterPrunedSearch(self):
+        self.train()
+        artifacts = Recommender(artifacts_dir=self.artifacts_dir).artifacts
+        exact_index = ExactIndex(artifacts)
+        query = np.asarray(artifacts["features"][0])
+
+        # Verify that probing every cluster finds the same songs as exact search
+        num_clusters = len(artifacts["kmeans"].cluster_centers_)
+        index = ClusterPrunedIndex(artifacts, num_probes=num_clusters)
+        self.assertEqual(
+            list(index.search(query, 10)), list(exact_index.search(query, 10))
+        )
+
+        # Verify that probing one cluster only finds songs in the closest cluster
+        # and falls back to exact search when there are too few of them
+        index = ClusterPrunedIndex(artifacts, num_probes=1)
+        cluster = artifacts["songs"]["cluster"][index.search(query, 1)[0]]
+        num_songs_in_cluster = len(index.rows_in_cluster(cluster))
+        self.assertTrue(
+            set(index.search(query, num_songs_in_cluster)).issubset(
+                index.rows_in_cluster(cluster)
+            )
+        )
+        self.assertEqual(
+            list(index.search(query, num_songs_in_cluster + 1)),
+            list(exact_index.search(query, num_songs_in_cluster + 1)),
+        )
+
+    def testBenchmarkRecommender(self):
+        self.train()
+        stdout = io.StringIO()
+        call_command(
+            "benchmark_recommender",
+            artifacts_dir=self.artifacts_dir,
+            num_queries=20,
+            num_probes=[1, 20],
+            stdout=stdout,
+        )
+        output = stdout.getvalue()
+        self.assertIn("exact            recall@10=1.000", output)
+        self.assertIn("20 probes        recall@10=1.000", output)
+        self.assertIn("p99=", output)
+
+
 class MusicAdminWebTestCase(PerDiemTestCase):
     def get200s(self):
-        return ["/admin/music/activityestimate/daily-report/"]
+        return [
+            "/admin/music/activityestimate/daily-report/",
+            "/admin/music/activityestimate/import-activity/",
+        ]
+
+    def testImportActivity(self):
+        track = TrackFactory(isrc="USABC1600001")
+        other_track = TrackFactory(name="Other Track")
+        report = (
+            "Date,ISRC,Artist,Track,Streams,Downloads\n"
+            "2020-01-01,usabc1600001,,,10,1\n"
+            "2020-01-01,,{artist},other  track,5,0\n"
+            "2020-01-01,,{artist},Unknown Track,5,0\n"
+            "not a date,USABC1600001,,,5,0\n"
+            "2020-01-01,USABC1600001\n"
+        ).format(artist=other_track.album.project.artist.name.upper())
+
+        # Import the report through the admin
+        self.assertResponseRedirects(
+            "/admin/music/activityestimate/import-activity/",
+            "/admin/music/activityestimate/",
+            method="POST",
+            data={"report": SimpleUploadedFile("report.csv", report.encode("utf-8"))},
+        )
+        self.assertEqual(track.total_streams(), 10)
+        self.assertEqual(track.total_downloads(), 1)
+        self.assertEqual(other_track.total_streams(), 5)
+
+        # Import a corrected report for the same day with the command,
+        # in batches smaller than the report
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write(report.replace(",10,1", ",20,2"))
+            f.flush()
+            stdout = io.StringIO()
+            call_command("import_activity", f.name, batch_size=1, stdout=stdout)
+        self.assertIn("Imported 5 rows (3 skipped)", stdout.getvalue())
+        self.assertIn("rows/s", stdout.getvalue())
+        self.assertEqual(track.total_streams(), 20)
+        self.assertEqual(track.total_downloads(), 2)
+        self.assertEqual(ActivityTotal.objects.verify(), [])
+
+    def testImportActivitySumsDuplicateRows(self):
+        track = TrackFactory(isrc="USABC1600001")
+        report = (
+            "Date,ISRC,Streams,Downloads\n"
+            "2020-01-01,USABC1600001,10,1\n"
+            "2020-01-02,USABC1600001,7,0\n"
+            "2020-01-01,USABC1600001,5,2\n"
+        )
+
+        # Import the report in batches that split the duplicated date and track
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write(report)
+            f.flush()
+            call_command("import_activity", f.name, batch_size=2, stdout=io.StringIO())
+        self.assertEqual(track.total_streams(), 22)
+        self.assertEqual(track.total_downloads(), 3)
+        self.assertEqual(ActivityTotal.objects.verify(), [])
+
+    def testImportActivityReportsInvalidFiles(self):
+        track = TrackFactory(isrc="USABC1600001")
+        valid_row = "2020-01-01,USABC1600001,10,1\n"
+        for report, error in (
+            (b"\xff\xfe" + valid_row.encode("utf-16-le"), b"UTF-8"),
+            (
+                "Date,ISRC,Streams,Downloads\n{valid_row}{field},,,\n".format(
+                    valid_row=valid_row, field="x" * (csv.field_size_limit() + 1)
+                ).encode("utf-8"),
+                b"not a valid CSV file",
+            ),
+        ):
+            response = self.assertResponseRenders(
+                "/admin/music/activityestimate/import-activity/",
+                method="POST",
+                data={"report": SimpleUploadedFile("report.csv", report)},
+                has_form_error=True,
+            )
+            self.assertIn(error, response.content)
+
+        # Verify that nothing was imported from the invalid reports
+        self.assertEqual(track.total_streams(), 0)
+
+    def testDailyReportUpsertsActivityEstimates(self):
+        tracks = [TrackFactory() for _ in range(3)]
+        for track in tracks:
+            CampaignFactory(project=track.album.project)
+
+        def submit_daily_report(streams, downloads):
+            data = {
+                "form-TOTAL_FORMS": len(tracks),
+                "form-INITIAL_FORMS": len(tracks),
+                "form-MIN_NUM_FORMS": len(tracks),
+                "form-MAX_NUM_FORMS": len(tracks),
+            }
+            for i, track in enumerate(tracks):
+                data.update(
+                    {
+                        f"form-{i}-track": track.id,
+                        f"form-{i}-streams": streams,
+                        f"form-{i}-downloads": downloads,
+                    }
+                )
+            self.assertResponseRedirects(
+                "/admin/music/activityestimate/daily-report/",
+                "/admin/music/activityestimate/",
+                method="POST",
+                data=data,
+            )
+
+        # Submit a daily report, then correct it
+        submit_daily_report(streams=10, downloads=0)
+        self.assertEqual(ActivityEstimate.objects.count(), len(tracks))
+        submit_daily_report(streams=5, downloads=2)
+
+        # Verify that the estimates and activity totals were updated
+        self.assertEqual(ActivityEstimate.objects.count(), 2 * len(tracks))
+        for track in tracks:
+            self.assertEqual(track.total_streams(), 5)
+            self.assertEqual(track.total_downloads(), 2)
+        self.assertEqual(ActivityTotal.objects.verify(), [])
+        self.assertEqual(MonthlyActivityTotal.objects.verify(), [])
+
+    def testDailyReportFiltersAndPages(self):
+        album = AlbumFactory()
+        tracks = [TrackFactory(album=album, name=name) for name in ("A", "B", "C")]
+        CampaignFactory(project=album.project)
+        TrackFactory(name="Other Track")
+        date = datetime.date(2020, 1, 1)
+        ActivityEstimateFactory(date=date, content_object=tracks[1])
+        url = "/admin/music/activityestimate/daily-report/"
+
+        def get_page_tracks(**filters):
+            response = self.client.get(url, filters)
+            self.assertEqual(response.status_code, 200)
+            return [form.initial["track"] for form in response.context["formset"]]
+
+        # Filter by album, then by tracks without estimates for the date
+        self.assertEqual(get_page_tracks(album=album.id), tracks)
+        self.assertEqual(
+            get_page_tracks(album=album.id, date=date, missing=True),
+            [tracks[0], tracks[2]],
+        )
+
+        # Submit the report one page at a time
+        filters = {"artist": album.project.artist.id, "date": date}
+        with mock.patch.object(DailyReportAdminView, "page_size", 2):
+            self.assertEqual(get_page_tracks(**filters), tracks[:2])
+            self.assertEqual(get_page_tracks(after=tracks[1].id, **filters), tracks[2:])
+            response = self.client.post(
+                "{url}?artist={artist}&date={date}".format(
+                    url=url, artist=album.project.artist.id, date=date
+                ),
+                {
+                    "form-TOTAL_FORMS": 2,
+                    "form-INITIAL_FORMS": 2,
+                    "form-MIN_NUM_FORMS": 2,
+                    "form-MAX_NUM_FORMS": 2,
+                    "form-0-track": tracks[0].id,
+                    "form-0-streams": 10,
+                    "form-0-downloads": 0,
+                    "form-1-track": tracks[1].id,
+                    "form-1-streams": 20,
+                    "form-1-downloads": 0,
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(f"after={tracks[1].id}", response.url)
+        self.assertEqual(
+            ActivityEstimate.objects.get(
+                date=date,
+                activity_type=ActivityEstimate.ACTIVITY_STREAM,
+                object_id=tracks[1].id,
+            ).total,
+            20,
+        )
+        self.assertEqual(tracks[0].total_streams(), 10)
 
     def testActivityEstimatesRequireCampaigns(self):
         album = AlbumFactory()
@@ -123,3 +555,30 @@ class MusicWebTestCase(PerDiemTestCase):
                 artist_slug=self.artist.slug, album_slug=self.album.slug
             ),
         ]
+
+    def testAlbumDetailQueryCountIsConstant(self):
+        url = "/artist/{artist_slug}/{album_slug}/".format(
+            artist_slug=self.artist.slug, album_slug=self.album.slug
+        )
+        TrackFactory(album=self.album)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertResponseRenders(url)
+
+        # Add tracks on another disc, with activity
+        for disc_number in (1, 2):
+            for _ in range(3):
+                track = TrackFactory(album=self.album, disc_number=disc_number)
+                ActivityEstimateFactory(content_object=track, total=7)
+        ActivityEstimateFactory(content_object=self.album, total=1)
+
+        # Verify that the album page still renders in the same number of queries
+        with self.assertNumQueries(len(queries)):
+            response = self.assertResponseRenders(url)
+        discs = response.context["album"].discs()
+        self.assertEqual([len(disc) for disc in discs], [4, 3])
+        self.assertEqual(discs, self.album.discs())
+        self.assertEqual(
+            [track.total_streams() for track in discs[1]],
+            [track.total_streams() for track in self.album.discs()[1]],
+        )
+        self.assertEqual(discs[1][0].total_streams(), 8)
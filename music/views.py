@@ -4,7 +4,7 @@
 
 """
 
-from django.shortcuts import get_object_or_404
+from django.http import Http404
 from django.views.generic import TemplateView
 from django.views.generic.list import ListView
 
@@ -26,11 +26,12 @@ class AlbumDetailView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        album = get_object_or_404(
-            Album,
-            slug=kwargs["album_slug"],
-            project__artist__slug=kwargs["artist_slug"],
-        )
+        try:
+            album = Album.objects.load(
+                slug=kwargs["album_slug"], project__artist__slug=kwargs["artist_slug"]
+            )
+        except Album.DoesNotExist:
+            raise Http404("No Album matches the given query.")
 
         user = self.request.user
         user_is_investor = (
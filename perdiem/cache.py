@@ -0,0 +1,132 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection
+
+
+class StaleWhileRevalidate:
+    """
+    Cache an expensive value, serving the previous value while a single worker rebuilds it
+
+    After soft_ttl seconds the cached value is stale: it is still served, but the
+    first request to acquire the rebuild lock recomputes it in a background thread.
+    After hard_ttl seconds the value is evicted and has to be rebuilt synchronously,
+    again by the worker holding the lock while the others wait up to lock_wait
+    seconds for its value.
+    """
+
+    LOCK_POLL_INTERVAL = 0.05
+
+    def __init__(
+        self,
+        key,
+        rebuild,
+        soft_ttl,
+        hard_ttl,
+        lock_ttl=60,
+        lock_wait=10,
+        background=True,
+    ):
+        self.key = key
+        self.lock_key = f"{key}-lock"
+        self.rebuild_func = rebuild
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        self.background = background
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "rebuilds": 0,
+            "last_rebuild_duration": None,
+            "max_rebuild_duration": 0,
+            "total_rebuild_duration": 0,
+        }
+
+    def count(self, stat):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def get(self):
+        cached = cache.get(self.key)
+        if cached is None:
+            self.count("misses")
+            return self.get_missing()
+
+        rebuilt_at, value = cached
+        if time.time() - rebuilt_at < self.soft_ttl:
+            self.count("hits")
+            return value
+
+        # Serve the stale value and let the worker holding the lock rebuild it
+        self.count("stale_hits")
+        if cache.add(self.lock_key, True, timeout=self.lock_ttl):
+            if self.background:
+                threading.Thread(
+                    target=self._rebuild_in_background, daemon=True
+                ).start()
+            else:
+                self._rebuild_and_unlock()
+        return value
+
+    def get_missing(self):
+        """
+        Rebuild a missing value, or wait for the worker holding the lock to rebuild it
+        """
+        deadline = time.monotonic() + self.lock_wait
+        while not cache.add(self.lock_key, True, timeout=self.lock_ttl):
+            time.sleep(self.LOCK_POLL_INTERVAL)
+            cached = cache.get(self.key)
+            if cached is not None:
+                return cached[1]
+            if time.monotonic() >= deadline:
+                # The lock holder is taking too long (or died), so stop waiting
+                return self.rebuild()
+
+        try:
+            # The value may have been rebuilt just before the lock was released
+            cached = cache.get(self.key)
+            if cached is not None:
+                return cached[1]
+            return self.rebuild()
+        finally:
+            cache.delete(self.lock_key)
+
+    def rebuild(self):
+        start = time.monotonic()
+        value = self.rebuild_func()
+        duration = time.monotonic() - start
+        cache.set(self.key, (time.time(), value), timeout=self.hard_ttl)
+
+        with self._stats_lock:
+            self.stats["rebuilds"] += 1
+            self.stats["last_rebuild_duration"] = duration
+            self.stats["max_rebuild_duration"] = max(
+                self.stats["max_rebuild_duration"], duration
+            )
+            self.stats["total_rebuild_duration"] += duration
+        return value
+
+    def invalidate(self):
+        """
+        Mark the cached value as stale without evicting it
+        """
+        cached = cache.get(self.key)
+        if cached is not None:
+            cache.set(self.key, (0, cached[1]), timeout=self.hard_ttl)
+
+    def _rebuild_and_unlock(self):
+        try:
+            self.rebuild()
+        finally:
+            cache.delete(self.lock_key)
+
+    def _rebuild_in_background(self):
+        try:
+            self._rebuild_and_unlock()
+        finally:
+            connection.close()
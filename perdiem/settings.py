@@ -120,6 +120,10 @@ class BaseConfig(Configuration):
             "LOCATION": "127.0.0.1:11211",
         }
     }
+    # How cached profile contexts are invalidated when revenue is reported:
+    # "investors" invalidates the contexts of each of the project's investors,
+    # "project" bumps the version of the project's cache namespace
+    PROFILE_CONTEXT_INVALIDATION = "investors"
 
     DB_NAME = values.Value(environ_prefix="PERDIEM", environ_required=True)
     DB_USER = values.Value(environ_prefix="PERDIEM", environ_required=True)
@@ -178,6 +182,18 @@ class BaseConfig(Configuration):
         },
     }
 
+    # Geocoding
+    GEOCODER_BACKEND = "artist.geolocator.NominatimGeocoder"
+
+    # Song recommendations
+    RECOMMENDER_ARTIFACTS_DIR = values.Value(
+        os.path.join(BASE_DIR, "recommender"), environ_prefix="PERDIEM"
+    )
+    RECOMMENDER_INDEX = "music.recommender.ClusterPrunedIndex"
+    RECOMMENDER_NUM_PROBES = 3  # More probed clusters trade latency for recall
+    SPOTIFY_CLIENT_ID = values.Value(environ_prefix="PERDIEM")
+    SPOTIFY_CLIENT_SECRET = values.Value(environ_prefix="PERDIEM")
+
     # Authentication
     AUTHENTICATION_BACKENDS = (
         "accounts.backends.GoogleOAuth2Login",
@@ -4,16 +4,24 @@
 
 """
 
+import time
+from unittest import mock
+
 from django.apps import apps
+from django.core.cache import cache
 from django.db import connection
 from django.db.migrations.executor import MigrationExecutor
 from django.test import TestCase, override_settings
 from pigeon.test import RenderTestCase
 
 from accounts.factories import UserFactory
+from perdiem.cache import StaleWhileRevalidate
 
 
-@override_settings(PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",))
+@override_settings(
+    PASSWORD_HASHERS=("django.contrib.auth.hashers.MD5PasswordHasher",),
+    GEOCODER_BACKEND="artist.geolocator.StubGeocoder",
+)
 class PerDiemTestCase(RenderTestCase):
 
     USER_USERNAME = "jsmith"
@@ -74,6 +82,67 @@ class MigrationTestCase(TestCase):
         pass
 
 
+class StaleWhileRevalidateTestCase(TestCase):
+    def setUp(self):
+        cache.delete_many(["expensive", "expensive-lock"])
+        self.rebuild = mock.Mock(side_effect=[1, 2, 3])
+        self.cached = StaleWhileRevalidate(
+            "expensive", self.rebuild, soft_ttl=60, hard_ttl=600, background=False
+        )
+
+    def testFreshValueIsServedFromCache(self):
+        self.assertEqual(self.cached.get(), 1)
+        self.assertEqual(self.cached.get(), 1)
+        self.assertEqual(self.rebuild.call_count, 1)
+        self.assertEqual(self.cached.stats["misses"], 1)
+        self.assertEqual(self.cached.stats["hits"], 1)
+        self.assertEqual(self.cached.stats["rebuilds"], 1)
+        self.assertIsNotNone(self.cached.stats["last_rebuild_duration"])
+
+    def testStaleValueIsServedWhileRebuilding(self):
+        self.cached.get()
+        self.cached.invalidate()
+
+        # The stale value is served while the value is rebuilt
+        self.assertEqual(self.cached.get(), 1)
+        self.assertEqual(self.cached.get(), 2)
+        self.assertEqual(self.cached.stats["stale_hits"], 1)
+        self.assertEqual(self.rebuild.call_count, 2)
+
+    def testOnlyLockHolderRebuildsStaleValue(self):
+        self.cached.get()
+        self.cached.invalidate()
+
+        # Another worker is already rebuilding the value
+        cache.add("expensive-lock", True)
+        self.assertEqual(self.cached.get(), 1)
+        self.assertEqual(self.cached.get(), 1)
+        self.assertEqual(self.rebuild.call_count, 1)
+
+    @mock.patch("perdiem.cache.time.sleep")
+    def testMissingValueIsRebuiltByLockHolder(self, mock_sleep):
+        # Another worker is already rebuilding the missing value
+        cache.add("expensive-lock", True)
+        mock_sleep.side_effect = lambda seconds: cache.set(
+            "expensive", (time.time(), 5)
+        )
+
+        # Verify that the value of the other worker is served
+        self.assertEqual(self.cached.get(), 5)
+        self.rebuild.assert_not_called()
+
+    @mock.patch("perdiem.cache.time.sleep")
+    def testMissingValueIsRebuiltAfterWaitingForLock(self, mock_sleep):
+        # A worker took the lock but never rebuilt the value
+        cache.add("expensive-lock", True)
+        self.cached.lock_wait = 0
+
+        # Verify that the value is rebuilt once waiting times out
+        self.assertEqual(self.cached.get(), 1)
+        self.assertEqual(self.rebuild.call_count, 1)
+        mock_sleep.assert_called_once()
+
+
 class HealthCheckWebTestCase(RenderTestCase):
     def get200s(self):
         return ["/health-check/"]